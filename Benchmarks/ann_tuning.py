@@ -0,0 +1,201 @@
+"""
+Recall/latency sweep and auto-tuner for the Annoy vector index.
+
+Builds Annoy indexes over the vectors of a processed corpus for each
+`n_trees` in a sweep, and queries each with a sweep of `search_k` values,
+given as multiples of Annoy's default `top_k * n_trees`. Every setting is
+reported with recall@k against exact search, p50/p99 single-query latency,
+build time and index size.
+
+With --target-recall, the cheapest setting that reaches the target (lowest
+p50 latency, then smallest index) is picked. With --write it is applied to
+the processed corpus as a new generation: the index is rebuilt if the tree
+count changed, and `search_k` is saved in metadata.json, where the
+QueryRunner picks it up.
+
+Usage:
+    python -m Benchmarks.ann_tuning --dataset-name SQuAD
+    python -m Benchmarks.ann_tuning --target-recall 0.95 --write
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import PROCESSED_DATA_PATH
+from Core.config import EMBEDDING_DIM
+from Core.generations import (
+    CURRENT_FILE, GENERATIONS_DIR, current_dir, generation_dir, new_generation_id, publish,
+)
+from Core.vector_backends import AnnoyBackend, NumpyBackend
+from factories.vector_backend_factory import DEFAULT_VECTOR_BACKEND
+from Benchmarks.ivf_vs_annoy import build, synthetic_vectors
+from Benchmarks.vector_quantization import load_queries, load_vectors
+
+
+def exact_search(vectors, queries, top_k):
+    backend = NumpyBackend(EMBEDDING_DIM)
+    backend.add_many(range(len(vectors)), vectors)
+    backend.build()
+    return backend.search_many(queries, top_k)
+
+
+def evaluate(backend, queries, top_k, exact):
+    """Returns recall@k and the p50 and p99 latency of single queries, in ms."""
+    latencies = []
+    recalls = []
+    for query, (exact_ids, _) in zip(queries, exact):
+        start_time = time.perf_counter()
+        ids, _ = backend.search(query, top_k)
+        latencies.append(1000 * (time.perf_counter() - start_time))
+        recalls.append(len(set(ids) & set(exact_ids)) / max(len(exact_ids), 1))
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return float(np.mean(recalls)), float(p50), float(p99)
+
+
+def sweep(vectors, queries, top_k, n_trees_values, search_k_factors):
+    exact = exact_search(vectors, queries, top_k)
+    rows = []
+    for n_trees in n_trees_values:
+        with tempfile.TemporaryDirectory() as index_dir:
+            build_time, size = build(AnnoyBackend(EMBEDDING_DIM, n_trees=n_trees), vectors, index_dir)
+            backend = AnnoyBackend.load(index_dir, EMBEDDING_DIM)
+            for factor in search_k_factors:
+                search_k = factor * top_k * n_trees
+                backend.configure_search(search_k=search_k)
+                recall, p50, p99 = evaluate(backend, queries, top_k, exact)
+                row = {
+                    "n_trees": n_trees, "search_k": search_k, "recall": recall,
+                    "p50_ms": p50, "p99_ms": p99, "build_time": build_time, "index_bytes": size,
+                }
+                print(
+                    f"{n_trees:8} {search_k:9} {recall:8.4f} {p50:8.3f} {p99:8.3f} "
+                    f"{build_time:8.2f}s {size / 2**20:8.1f}MB"
+                )
+                rows.append(row)
+            backend.unload()
+    return rows
+
+
+def pick_setting(rows, target_recall):
+    """The cheapest row reaching `target_recall`, or None if none does."""
+    candidates = [row for row in rows if row["recall"] >= target_recall]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: (row["p50_ms"], row["index_bytes"]))
+
+
+def published_backend(processed_dir):
+    """The vector backend of the published build. Builds that predate pluggable backends are Annoy."""
+    with open(current_dir(processed_dir) / "metadata.json", "r") as f:
+        return json.load(f).get("vector_backend", DEFAULT_VECTOR_BACKEND)
+
+
+def write_setting(processed_dir, vectors, setting, target_recall, top_k, n_queries):
+    """
+    Applies a tuned setting to a processed corpus.
+
+    The current build is copied to a new generation, its Annoy index is
+    rebuilt if the tree count changed and its metadata records the setting;
+    the copy is then published, so running servers swap to it like to any
+    other build.
+
+    Raises
+    ------
+    ValueError
+        If the published build does not use the Annoy backend, which the
+        tuned settings would not apply to.
+    """
+    source_dir = current_dir(processed_dir)
+    backend_type = published_backend(processed_dir).get("type", "annoy")
+    if backend_type != "annoy":
+        raise ValueError(f"{processed_dir} uses the {backend_type} vector backend; only Annoy indexes can be tuned.")
+    generation = new_generation_id()
+    target_dir = generation_dir(processed_dir, generation)
+    shutil.copytree(
+        source_dir, target_dir,
+        ignore=shutil.ignore_patterns(GENERATIONS_DIR, f"{CURRENT_FILE}*", "query_cache", "staging"),
+    )
+
+    with open(target_dir / "metadata.json", "r") as f:
+        metadata = json.load(f)
+    backend_config = dict(metadata.get("vector_backend", DEFAULT_VECTOR_BACKEND))
+    if backend_config.get("n_trees", AnnoyBackend(EMBEDDING_DIM).n_trees) != setting["n_trees"]:
+        backend_config["n_trees"] = setting["n_trees"]
+        build(AnnoyBackend(EMBEDDING_DIM, n_trees=setting["n_trees"]), vectors, target_dir)
+
+    metadata["generation"] = generation
+    metadata["vector_backend"] = backend_config
+    metadata["vector_search"] = {**metadata.get("vector_search", {}), "search_k": setting["search_k"]}
+    metadata["ann_tuning"] = {
+        "target_recall": target_recall,
+        "top_k": top_k,
+        "queries": n_queries,
+        **setting,
+    }
+    with open(target_dir / "metadata.json", "w") as f:
+        json.dump(metadata, f, indent=4)
+    publish(processed_dir, generation)
+    return target_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep and tune Annoy's n_trees and search_k.")
+    parser.add_argument("--dataset-name", type=str, default="SQuAD", help="Question-answer set to query with.")
+    parser.add_argument("--processed-dir", type=str, default=None,
+                        help="Processed corpus to read vectors from. Defaults to the production index.")
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="Use this many synthetic vectors (and 1000 synthetic queries) instead.")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-trees", type=int, nargs="+", default=[5, 10, 25, 50, 100])
+    parser.add_argument("--search-k-factors", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="search_k values as multiples of top_k * n_trees, Annoy's default.")
+    parser.add_argument("--target-recall", type=float, default=None,
+                        help="Pick the cheapest setting with at least this recall@k.")
+    parser.add_argument("--write", action="store_true",
+                        help="Apply the picked setting to the processed corpus.")
+    args = parser.parse_args()
+
+    if args.write and (args.target_recall is None or args.synthetic):
+        parser.error("--write needs --target-recall and a processed corpus.")
+
+    if args.synthetic:
+        vectors, queries = synthetic_vectors(args.synthetic, 1000)
+    else:
+        processed_dir = Path(args.processed_dir) if args.processed_dir else PROCESSED_DATA_PATH / "Production"
+        backend_type = published_backend(processed_dir).get("type", "annoy")
+        if args.write and backend_type != "annoy":
+            parser.error(f"--write only applies to Annoy indexes; {processed_dir} uses {backend_type}.")
+        vectors, model_name = load_vectors(processed_dir)
+        queries = load_queries(args.dataset_name, model_name)
+    print(f"{len(vectors)} vectors, {len(queries)} queries, recall@{args.top_k} vs exact search\n")
+
+    print(f"{'n_trees':>8} {'search_k':>9} {'recall':>8} {'p50 ms':>8} {'p99 ms':>8} {'build':>9} {'size':>10}")
+    rows = sweep(vectors, queries, args.top_k, args.n_trees, args.search_k_factors)
+    if args.target_recall is None:
+        return
+
+    setting = pick_setting(rows, args.target_recall)
+    if setting is None:
+        best = max(row["recall"] for row in rows)
+        print(f"\nNo setting reaches recall {args.target_recall}; the best is {best:.4f}.")
+        raise SystemExit(1)
+    print(
+        f"\nCheapest setting with recall >= {args.target_recall}: n_trees={setting['n_trees']}, "
+        f"search_k={setting['search_k']} (recall {setting['recall']:.4f}, p50 {setting['p50_ms']:.3f} ms)"
+    )
+
+    if args.write:
+        target_dir = write_setting(processed_dir, vectors, setting, args.target_recall, args.top_k, len(queries))
+        print(
+            f"Published as {target_dir}. Set annoy_trees to {setting['n_trees']} "
+            "in the config so later builds keep the tuned tree count."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Guard the import cost of the project's entry-point modules.
+
+Each module is imported in a fresh interpreter with `-X importtime`. The
+benchmark reports its cumulative import time and the slowest packages it
+pulled in, and exits with status 1 if any module exceeds its budget or
+imports one of the heavy dependencies that must only be loaded lazily
+(torch, sentence_transformers, spaCy, NLTK, pandas, langchain).
+
+Usage:
+    python -m Benchmarks.import_time --budget-ms 1000
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+DEFAULT_MODULES = [
+    "Core.tokenizer",
+    "Core.splitter",
+    "Core.ranker",
+    "Core.corpus_processor",
+    "Core.query_runner",
+    "factories.embedding_model_factory",
+    "SearchApp.search_orchestrator",
+    "SearchApp.run_search",
+]
+
+LAZY_DEPENDENCIES = ["torch", "sentence_transformers", "spacy", "nltk", "pandas", "langchain"]
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _import_times(statement):
+    """Runs `statement` under `-X importtime`; returns {module: cumulative ms}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Running {statement!r} failed:\n{result.stderr}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def measure(module, runs, startup_modules):
+    """
+    Imports `module` in `runs` fresh interpreters.
+
+    Returns
+    -------
+    tuple[float, dict[str, float]]
+        The best cumulative import time of the module in milliseconds, and
+        for that run the import time of every top-level package the module
+        pulled in, excluding the project's own packages and modules the
+        interpreter loads at startup.
+    """
+    best = None
+    for _ in range(runs):
+        times = _import_times(f"import {module}")
+        if best is None or times[module] < best[0]:
+            best = (times[module], times)
+
+    total_ms, times = best
+    packages = {}
+    for name, ms in times.items():
+        if name in startup_modules or name == module:
+            continue
+        # The outermost import of a package has the largest cumulative time
+        root = name.split(".")[0]
+        if (REPO_ROOT / root).is_dir() or (REPO_ROOT / f"{root}.py").exists():
+            continue  # Project code; only dependencies are listed
+        packages[root] = max(packages.get(root, 0), ms)
+    return total_ms, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of entry-point modules.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="Modules to import.")
+    parser.add_argument("--budget-ms", type=float, default=1000, help="Maximum import time per module.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh imports per module; the fastest is kept.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest packages to show per module.")
+    args = parser.parse_args()
+
+    startup_modules = set(_import_times("pass"))
+    failures = []
+    for module in args.modules:
+        total_ms, packages = measure(module, args.runs, startup_modules)
+        eager = sorted(set(packages) & set(LAZY_DEPENDENCIES))
+        status = "ok" if total_ms <= args.budget_ms and not eager else "FAIL"
+        print(f"{module:40} {total_ms:9.1f} ms  {status}")
+
+        slowest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        for name, ms in slowest:
+            print(f"    {name:36} {ms:9.1f} ms")
+
+        if total_ms > args.budget_ms:
+            failures.append(f"{module} took {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if eager:
+            failures.append(f"{module} eagerly imports {', '.join(eager)}")
+
+    if failures:
+        print("\nImport time budget exceeded:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
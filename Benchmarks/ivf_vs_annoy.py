@@ -0,0 +1,109 @@
+"""
+Compare the IVF vector backend with Annoy on the same chunks.
+
+Both backends are built from the vectors of a processed corpus (or from
+synthetic clustered vectors with --synthetic) and queried with the same
+queries. For each configuration the report shows build time, index size,
+recall@k against exact search and query latency. IVF is evaluated at
+several `nprobe` values from a single build.
+
+Usage:
+    python -m Benchmarks.ivf_vs_annoy --dataset-name SQuAD
+    python -m Benchmarks.ivf_vs_annoy --synthetic 1000000 --nprobe 1 4 16 64
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import PROCESSED_DATA_PATH
+from Core.config import EMBEDDING_DIM
+from Core.vector_backends import AnnoyBackend, IVFBackend, NumpyBackend
+from Benchmarks.vector_quantization import load_queries, load_vectors
+
+
+def synthetic_vectors(n_vectors, n_queries, seed=0):
+    """Gaussian clusters, which have more structure than uniform noise, like real embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n_vectors // 250), EMBEDDING_DIM))
+    vectors = centers[rng.integers(0, len(centers), n_vectors)] + 0.8 * rng.normal(size=(n_vectors, EMBEDDING_DIM))
+    queries = centers[rng.integers(0, len(centers), n_queries)] + 0.8 * rng.normal(size=(n_queries, EMBEDDING_DIM))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def build(backend, vectors, index_dir):
+    start_time = time.perf_counter()
+    backend.add_many(range(len(vectors)), vectors)
+    backend.build()
+    backend.save(index_dir)
+    build_time = time.perf_counter() - start_time
+    size = sum(path.stat().st_size for path in Path(index_dir).iterdir())
+    return build_time, size
+
+
+def evaluate(backend, queries, top_k, exact):
+    start_time = time.perf_counter()
+    results = backend.search_many(queries, top_k)
+    elapsed = time.perf_counter() - start_time
+    recall = np.mean([
+        len(set(ids) & set(exact_ids)) / max(len(exact_ids), 1)
+        for (ids, _), (exact_ids, _) in zip(results, exact)
+    ])
+    return recall, 1000 * elapsed / max(len(queries), 1)
+
+
+def report(name, build_time, size, recall, ms_per_query):
+    print(f"{name:24} {build_time:9.2f}s {size / 2**20:10.1f}MB {recall:8.4f} {ms_per_query:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare IVF and Annoy vector indexes.")
+    parser.add_argument("--dataset-name", type=str, default="SQuAD", help="Question-answer set to query with.")
+    parser.add_argument("--processed-dir", type=str, default=None,
+                        help="Processed corpus to read vectors from. Defaults to the production index.")
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="Use this many synthetic vectors (and 1000 synthetic queries) instead.")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF lists. Defaults to sqrt(n).")
+    parser.add_argument("--annoy-trees", type=int, nargs="+", default=[10, 50])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors, queries = synthetic_vectors(args.synthetic, 1000)
+    else:
+        processed_dir = Path(args.processed_dir) if args.processed_dir else PROCESSED_DATA_PATH / "Production"
+        vectors, model_name = load_vectors(processed_dir)
+        queries = load_queries(args.dataset_name, model_name)
+    print(f"{len(vectors)} vectors, {len(queries)} queries, recall@{args.top_k} vs exact search\n")
+
+    exact_backend = NumpyBackend(EMBEDDING_DIM)
+    exact_backend.add_many(range(len(vectors)), vectors)
+    exact_backend.build()
+    start_time = time.perf_counter()
+    exact = exact_backend.search_many(queries, args.top_k)
+    exact_ms = 1000 * (time.perf_counter() - start_time) / max(len(queries), 1)
+
+    print(f"{'index':24} {'build':>10} {'size':>12} {'recall':>8} {'ms/query':>9}")
+    report("exact (numpy)", 0, exact_backend.memory_bytes, 1.0, exact_ms)
+
+    for n_trees in args.annoy_trees:
+        with tempfile.TemporaryDirectory() as index_dir:
+            build_time, size = build(AnnoyBackend(EMBEDDING_DIM, n_trees=n_trees), vectors, index_dir)
+            backend = AnnoyBackend.load(index_dir, EMBEDDING_DIM)
+            report(f"annoy n_trees={n_trees}", build_time, size, *evaluate(backend, queries, args.top_k, exact))
+            backend.unload()
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        build_time, size = build(IVFBackend(EMBEDDING_DIM, n_lists=args.n_lists), vectors, index_dir)
+        backend = IVFBackend.load(index_dir, EMBEDDING_DIM)
+        for nprobe in args.nprobe:
+            backend.configure_search(nprobe=nprobe)
+            report(f"ivf nprobe={nprobe}", build_time, size, *evaluate(backend, queries, args.top_k, exact))
+        backend.unload()
+
+
+if __name__ == "__main__":
+    main()
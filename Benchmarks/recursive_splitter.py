@@ -0,0 +1,94 @@
+"""
+Benchmark the offset-tracking recursive splitter on large markdown files.
+
+Builds a multi-megabyte document by repeating the corpus (repetition is
+what makes `str.find` based range recovery both slow and wrong), then
+times `TextSplitter._recursive_split`. If langchain is installed, the old
+path (langchain's splitter plus `find` for ranges) is timed as well and
+the number of chunks whose recovered range does not point at the chunk's
+actual position is reported.
+
+Usage:
+    python -m Benchmarks.recursive_splitter --data-dir TestData/SQuAD --size-mb 4
+"""
+import argparse
+import time
+from pathlib import Path
+
+from Core.config import RECURSIVE_SPLITTER_CONFIG
+from Core.corpus_data import CorpusData
+from Core.splitter import TextSplitter
+from path_utils import DEFAULT_DATA_PATH
+
+
+def build_document(data_dir, size_mb):
+    corpus_text = "\n\n".join(CorpusData(Path(data_dir)).data.values())
+    target_chars = int(size_mb * 1024 * 1024)
+    repeats = max(1, target_chars // max(len(corpus_text), 1) + 1)
+    return ("\n\n".join([corpus_text] * repeats))[:target_chars]
+
+
+def run_native(document):
+    splitter = TextSplitter(methods=["recursive_split"], nlp=None)
+    start_time = time.perf_counter()
+    splits = splitter._recursive_split(document)
+    return splits, time.perf_counter() - start_time
+
+
+def run_langchain(document):
+    """The splitting path TextSplitter used before the native splitter."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    large_splitter = RecursiveCharacterTextSplitter(**RECURSIVE_SPLITTER_CONFIG["large_w_overlap"])
+    small_splitter = RecursiveCharacterTextSplitter(**RECURSIVE_SPLITTER_CONFIG["small_w_overlap"])
+
+    start_time = time.perf_counter()
+    splits = []
+    for large_chunk in large_splitter.split_text(document):
+        large_start = document.find(large_chunk)
+        splits.append({"text": large_chunk, "range": [large_start, large_start + len(large_chunk)]})
+        for small_chunk in small_splitter.split_text(large_chunk):
+            small_start = large_start + large_chunk.find(small_chunk)
+            splits.append({"text": small_chunk, "range": [small_start, small_start + len(small_chunk)]})
+    return splits, time.perf_counter() - start_time
+
+
+def count_misplaced(native_splits, other_splits):
+    """Counts chunks whose range differs from the native splitter's exact range."""
+    return sum(
+        1 for native, other in zip(native_splits, other_splits)
+        if native["range"] != other["range"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recursive splitter.")
+    parser.add_argument("--data-dir", type=str, default=DEFAULT_DATA_PATH, help="Directory containing markdown files.")
+    parser.add_argument("--size-mb", type=float, default=4, help="Size of the generated document.")
+    args = parser.parse_args()
+
+    document = build_document(args.data_dir, args.size_mb)
+    megabytes = len(document) / (1024 * 1024)
+    print(f"Document: {len(document)} characters")
+
+    native_splits, native_time = run_native(document)
+    assert all(document[s["range"][0]:s["range"][1]] == s["text"] for s in native_splits)
+    print(f"native:    {native_time:8.2f}s  {megabytes / native_time:8.2f} MB/s  {len(native_splits)} chunks")
+
+    try:
+        langchain_splits, langchain_time = run_langchain(document)
+    except ImportError:
+        print("langchain not installed; skipping comparison.")
+        return
+
+    print(f"langchain: {langchain_time:8.2f}s  {megabytes / langchain_time:8.2f} MB/s  {len(langchain_splits)} chunks")
+    print(f"speedup:   {langchain_time / native_time:8.2f}x")
+    if [s["text"] for s in native_splits] == [s["text"] for s in langchain_splits]:
+        misplaced = count_misplaced(native_splits, langchain_splits)
+        print(f"identical chunk text; {misplaced} chunks had wrong ranges on the old path")
+    else:
+        print("WARNING: chunk text differs between splitters")
+
+
+if __name__ == "__main__":
+    main()
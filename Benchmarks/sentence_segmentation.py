@@ -0,0 +1,108 @@
+"""
+Benchmark sentence segmentation modes against the original splitting path.
+
+The baseline runs the full en_core_web_sm pipeline on one document at a
+time, which is how `TextSplitter._by_sentence` used to work. Each mode from
+`load_sentence_pipeline` is then run through `TextSplitter.split_many` and
+compared on throughput and on how many sentence boundaries it shares with
+the baseline.
+
+Usage:
+    python -m Benchmarks.sentence_segmentation --data-dir TestData/SQuAD
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from Core.corpus_data import CorpusData
+from Core.splitter import TextSplitter, load_sentence_pipeline
+from path_utils import DEFAULT_DATA_PATH
+
+MODES = ["full", "parser", "senter", "rule"]
+
+
+def boundary_agreement(reference, candidate):
+    """
+    Precision, recall and F1 of the candidate's sentence boundaries.
+
+    A boundary is a (document index, sentence end offset) pair.
+    """
+    reference = set(reference)
+    candidate = set(candidate)
+    shared = len(reference & candidate)
+    precision = shared / len(candidate) if candidate else 1.0
+    recall = shared / len(reference) if reference else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def boundaries(splits_per_document):
+    return [
+        (doc_index, split["range"][1])
+        for doc_index, splits in enumerate(splits_per_document)
+        for split in splits
+    ]
+
+
+def run_baseline(documents):
+    splitter = TextSplitter(methods=["by_sentence"], nlp=load_sentence_pipeline("full"))
+    start_time = time.perf_counter()
+    splits = [splitter.split(document) for document in documents]
+    return splits, time.perf_counter() - start_time
+
+
+def run_mode(documents, mode, batch_size, n_process):
+    splitter = TextSplitter(methods=["by_sentence"], nlp=load_sentence_pipeline(mode))
+    start_time = time.perf_counter()
+    splits = list(splitter.split_many(documents, batch_size=batch_size, n_process=n_process))
+    return splits, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sentence segmentation modes.")
+    parser.add_argument("--data-dir", type=str, default=DEFAULT_DATA_PATH, help="Directory containing markdown files.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="Modes to benchmark.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documents per nlp.pipe batch.")
+    parser.add_argument("--n-process", type=int, default=1, help="Worker processes for nlp.pipe.")
+    parser.add_argument("--output", type=str, default=None, help="Optional path to write results as JSON.")
+    args = parser.parse_args()
+
+    documents = list(CorpusData(Path(args.data_dir)).data.values())
+    total_chars = sum(len(document) for document in documents)
+    print(f"Benchmarking {len(documents)} documents ({total_chars} characters)")
+
+    baseline_splits, baseline_time = run_baseline(documents)
+    reference = boundaries(baseline_splits)
+    results = {
+        "baseline": {
+            "seconds": baseline_time,
+            "chars_per_second": total_chars / baseline_time,
+            "sentences": len(reference),
+        }
+    }
+
+    for mode in args.modes:
+        splits, elapsed = run_mode(documents, mode, args.batch_size, args.n_process)
+        results[mode] = {
+            "seconds": elapsed,
+            "chars_per_second": total_chars / elapsed,
+            "speedup": baseline_time / elapsed,
+            "sentences": len(boundaries(splits)),
+            **boundary_agreement(reference, boundaries(splits)),
+        }
+
+    print(f"{'mode':<10}{'seconds':>10}{'chars/s':>14}{'speedup':>10}{'sentences':>11}{'F1':>8}")
+    for mode, result in results.items():
+        print(
+            f"{mode:<10}{result['seconds']:>10.2f}{result['chars_per_second']:>14.0f}"
+            f"{result.get('speedup', 1.0):>10.2f}{result['sentences']:>11}{result.get('f1', 1.0):>8.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Recall-vs-memory report for quantized vector storage.
+
+Takes the vectors of a processed corpus, rebuilds them as NumPy backends
+with float32, float16 and int8 storage, and runs the SQuAD test questions
+against each. Recall@k is measured against exact float32 search; memory is
+the size of the matrix each search scans.
+
+Usage:
+    python -m Benchmarks.vector_quantization --dataset-name SQuAD --top-k 10
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import PROCESSED_DATA_PATH
+from Core.config import EMBEDDING_DIM
+from Core.generations import current_dir
+from Core.vector_backends import NumpyBackend
+from factories.embedding_model_factory import EmbeddingModelFactory
+from factories.vector_backend_factory import DEFAULT_VECTOR_BACKEND, VectorBackendFactory
+from TestRunner.models import QuestionAnswer
+
+
+def load_vectors(processed_dir):
+    """Reads every vector of a processed corpus, whatever backend it was built with."""
+    processed_dir = current_dir(processed_dir)
+    with open(processed_dir / "metadata.json", "r") as f:
+        metadata = json.load(f)
+    backend = VectorBackendFactory().load(
+        metadata.get("vector_backend", DEFAULT_VECTOR_BACKEND), processed_dir, EMBEDDING_DIM
+    )
+    vectors = np.array([backend.get_vector(i) for i in range(len(backend))], dtype=np.float32)
+    return vectors, metadata["config"]["embedding_model"]
+
+
+def load_queries(dataset_name, model_name):
+    questions = [case["query"] for case in QuestionAnswer(dataset_name).question_answer if case.get("query")]
+    model = EmbeddingModelFactory().get_model(model_name)
+    return np.asarray(model.encode(questions), dtype=np.float32)
+
+
+def evaluate(vectors, queries, quantization, top_k, rescore_factor):
+    with tempfile.TemporaryDirectory() as index_dir:
+        backend = NumpyBackend(EMBEDDING_DIM, quantization=quantization, rescore_factor=rescore_factor)
+        backend.add_many(range(len(vectors)), vectors)
+        backend.build()
+        backend.save(index_dir)
+        backend = NumpyBackend.load(index_dir, EMBEDDING_DIM, quantization=quantization,
+                                    rescore_factor=rescore_factor)
+
+        start_time = time.perf_counter()
+        results = backend.search_many(queries, top_k)
+        elapsed = time.perf_counter() - start_time
+        memory_bytes = backend.memory_bytes
+        backend.unload()
+    return results, memory_bytes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall vs memory of quantized vector storage.")
+    parser.add_argument("--dataset-name", type=str, default="SQuAD", help="Question-answer set to query with.")
+    parser.add_argument("--processed-dir", type=str, default=None,
+                        help="Processed corpus to read vectors from. Defaults to the production index.")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    processed_dir = Path(args.processed_dir) if args.processed_dir else PROCESSED_DATA_PATH / "Production"
+    vectors, model_name = load_vectors(processed_dir)
+    queries = load_queries(args.dataset_name, model_name)
+    print(f"{len(vectors)} vectors, {len(queries)} queries, recall@{args.top_k} vs exact float32\n")
+
+    exact, _, _ = evaluate(vectors, queries, None, args.top_k, args.rescore_factor)
+    print(f"{'storage':10} {'memory':>12} {'bytes/chunk':>12} {'recall':>8} {'ms/query':>9}")
+    for quantization in (None, "float16", "int8"):
+        results, memory_bytes, elapsed = evaluate(
+            vectors, queries, quantization, args.top_k, args.rescore_factor
+        )
+        recall = np.mean([
+            len(set(ids) & set(exact_ids)) / max(len(exact_ids), 1)
+            for (ids, _), (exact_ids, _) in zip(results, exact)
+        ])
+        print(
+            f"{quantization or 'float32':10} {memory_bytes / 2**20:10.2f}MB "
+            f"{memory_bytes / max(len(vectors), 1):12.0f} {recall:8.4f} "
+            f"{1000 * elapsed / max(len(queries), 1):9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
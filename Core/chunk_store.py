@@ -0,0 +1,238 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from Core.spill import ColumnSpill
+
+
+class ChunkStore:
+    """
+    Columnar metadata for every chunk, addressed by integer chunk id.
+
+    Each field is a NumPy array with one entry per chunk, memory-mapped when
+    loaded from disk:
+        - doc_ids: int32 index into the document table (file paths).
+        - starts / ends: int32 character offsets of the chunk in its document.
+        - methods: uint8 index into the splitting method table.
+        - granularities: uint8 index into the granularity table.
+        - text_ends: int64 end offset of each chunk's text in `text`.
+
+    By default a chunk's text is sliced out of its source document using
+    the chunk's offsets, with recently used documents kept in memory. This
+    keeps the store small, but results are only correct while the source
+    files stay where they were and are not edited after indexing.
+
+    Stores built with `store_text` also hold every chunk's text back to
+    back as one UTF-8 byte array, `text`, so results no longer depend on
+    the source files, at the cost of a second copy of the corpus on disk.
+    """
+
+    _ARRAYS = ("doc_ids", "starts", "ends", "methods", "granularities")
+    _TEXT_ARRAYS = ("text", "text_ends")
+
+    def __init__(self, documents, method_names, granularity_names, doc_ids, starts, ends,
+                 methods, granularities, text=None, text_ends=None, document_cache_size=64):
+        """
+        Parameters
+        ----------
+        documents : list[str]
+            Path of every document, indexed by doc id.
+        method_names : list[str]
+            Name of every splitting method, indexed by method id.
+        granularity_names : list[str | None]
+            Name of every granularity, indexed by granularity id.
+        doc_ids, starts, ends, methods, granularities : np.ndarray
+            Per-chunk columns, see the class docstring.
+        text, text_ends : np.ndarray, optional
+            UTF-8 bytes of every chunk's text and their end offsets.
+        document_cache_size : int
+            Number of source documents kept in memory for text lookups.
+        """
+        self.documents = documents
+        self.method_names = method_names
+        self.granularity_names = granularity_names
+        self.doc_ids = doc_ids
+        self.starts = starts
+        self.ends = ends
+        self.methods = methods
+        self.granularities = granularities
+        self.text = text
+        self.text_ends = text_ends
+        self._read_document = lru_cache(maxsize=document_cache_size)(self._read_document)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def get(self, chunk_id):
+        """
+        Returns the metadata of a chunk.
+
+        Returns
+        -------
+        dict
+            The chunk's "location", "char_range", "splitting_method",
+            "granularity" and "text".
+        """
+        chunk = self.get_metadata(chunk_id)
+        if self.text is not None:
+            chunk_id = int(chunk_id)
+            start = int(self.text_ends[chunk_id - 1]) if chunk_id > 0 else 0
+            chunk["text"] = bytes(self.text[start:int(self.text_ends[chunk_id])]).decode("utf-8")
+        else:
+            start, end = chunk["char_range"]
+            chunk["text"] = self._read_document(chunk["location"])[start:end]
+        return chunk
+
+    def get_metadata(self, chunk_id):
+        """Like `get`, without reading the chunk's text from its document."""
+        chunk_id = int(chunk_id)
+        return {
+            "location": self.documents[self.doc_ids[chunk_id]],
+            "char_range": [int(self.starts[chunk_id]), int(self.ends[chunk_id])],
+            "splitting_method": self.method_names[self.methods[chunk_id]],
+            "granularity": self.granularity_names[self.granularities[chunk_id]],
+        }
+
+    def _read_document(self, location):
+        # Read the same way CorpusData does so character offsets line up
+        with open(location, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def save(self, store_dir: Path):
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+        for name in self._ARRAYS + self._TEXT_ARRAYS:
+            if getattr(self, name) is not None:
+                np.save(store_dir / f"{name}.npy", getattr(self, name))
+        with open(store_dir / "tables.json", "w") as f:
+            json.dump(
+                {
+                    "documents": self.documents,
+                    "methods": self.method_names,
+                    "granularities": self.granularity_names,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, store_dir: Path, mmap=True):
+        """Loads a saved store, memory-mapping its columns unless `mmap` is False."""
+        store_dir = Path(store_dir)
+        with open(store_dir / "tables.json", "r") as f:
+            tables = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(store_dir / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in cls._ARRAYS + cls._TEXT_ARRAYS
+            if (store_dir / f"{name}.npy").exists()
+        }
+        return cls(tables["documents"], tables["methods"], tables["granularities"], **arrays)
+
+
+class ChunkStoreBuilder:
+    """
+    Collects chunk metadata in chunk id order and produces a ChunkStore.
+
+    With a `spill_dir`, the per-chunk columns are appended to files in that
+    directory as chunks are added instead of being kept in memory, and the
+    store is written out with `save`.
+    """
+
+    _DTYPES = {
+        "doc_ids": np.int32,
+        "starts": np.int32,
+        "ends": np.int32,
+        "methods": np.uint8,
+        "granularities": np.uint8,
+        "text": np.uint8,
+        "text_ends": np.int64,
+    }
+
+    def __init__(self, spill_dir: Path = None, store_text=False):
+        """
+        Parameters
+        ----------
+        spill_dir : Path, optional
+            Directory the per-chunk columns are appended to as chunks are added.
+        store_text : bool
+            Whether to store a copy of every chunk's text, see `ChunkStore`.
+        """
+        self.store_text = store_text
+        self._array_names = ChunkStore._ARRAYS + (ChunkStore._TEXT_ARRAYS if store_text else ())
+        self._documents = {}  # location as added -> doc id
+        self._document_paths = []  # Absolute path of every document, by doc id
+        self._methods = {}
+        self._granularities = {None: 0}
+        if spill_dir is None:
+            self._columns = {name: [] for name in self._array_names}
+        else:
+            self._columns = {
+                name: ColumnSpill(Path(spill_dir) / f"{name}.bin", self._DTYPES[name])
+                for name in self._array_names
+            }
+        self._text_bytes = 0
+        self._spilled = spill_dir is not None
+
+    def __len__(self):
+        return len(self._columns["doc_ids"])
+
+    def add(self, location, text, char_range, splitting_method, granularity=None):
+        """
+        Appends the next chunk. Its chunk id is the number of chunks added before it.
+
+        `location` is stored as an absolute path, so it stays valid when
+        the store is read from another working directory. `text` is only
+        kept by builders created with `store_text`.
+        """
+        doc_id = self._documents.get(location)
+        if doc_id is None:
+            doc_id = self._documents[location] = len(self._document_paths)
+            self._document_paths.append(str(Path(location).resolve()))
+        self._columns["doc_ids"].append(doc_id)
+        if self.store_text:
+            encoded = text.encode("utf-8")
+            self._columns["text"].extend(encoded)
+            self._text_bytes += len(encoded)
+            self._columns["text_ends"].append(self._text_bytes)
+        self._columns["starts"].append(char_range[0])
+        self._columns["ends"].append(char_range[1])
+        self._columns["methods"].append(self._methods.setdefault(splitting_method, len(self._methods)))
+        self._columns["granularities"].append(
+            self._granularities.setdefault(granularity, len(self._granularities))
+        )
+
+    def build(self):
+        if self._spilled:
+            raise RuntimeError("A spilled ChunkStoreBuilder is written out with save().")
+        return ChunkStore(
+            documents=list(self._document_paths),
+            method_names=list(self._methods),
+            granularity_names=list(self._granularities),
+            **{
+                name: np.asarray(self._columns[name], dtype=self._DTYPES[name])
+                for name in self._array_names
+            },
+        )
+
+    def save(self, store_dir: Path):
+        """Writes the store to `store_dir` in the format read by `ChunkStore.load`."""
+        if not self._spilled:
+            self.build().save(store_dir)
+            return
+
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+        for name, column in self._columns.items():
+            column.save_npy(store_dir / f"{name}.npy")
+            column.close()
+        with open(store_dir / "tables.json", "w") as f:
+            json.dump(
+                {
+                    "documents": list(self._document_paths),
+                    "methods": list(self._methods),
+                    "granularities": list(self._granularities),
+                },
+                f,
+            )
@@ -38,4 +38,11 @@ RECURSIVE_SPLITTER_CONFIG = {
         "chunk_overlap": 0,
         "length_function": len
     }
-}
\ No newline at end of file
+}
+
+# Dimensionality of the all-MiniLM-L6-v2 sentence embeddings
+EMBEDDING_DIM = 384
+
+# Number of chunks encoded per SentenceTransformer forward pass when
+# embedding a corpus. Overridden by "embedding_batch_size" in the run config.
+EMBEDDING_BATCH_SIZE = 64
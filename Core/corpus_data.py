@@ -1,3 +1,5 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
@@ -10,11 +12,15 @@ class CorpusData:
     provides functionality to retrieve specific passages based on file names
     and character ranges.
 
+    With `streaming=True` no file is read up front. Documents are read on
+    demand by `iter_documents`, so memory use does not grow with the size
+    of the corpus.
+
     Currently, only markdown files are supported. Future versions may
     support additional file types.
     """
 
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, streaming=False, read_workers=8):
         """
         Initialize the CorpusData class.
 
@@ -22,16 +28,24 @@ class CorpusData:
         ----------
         path : Path
             The root directory containing the markdown files to be analyzed.
+        streaming : bool
+            If True, file contents are not loaded into `data`.
+        read_workers : int
+            Number of threads reading files in `iter_documents`.
 
         Attributes
         ----------
         dataset_name : str
             The name of the parent folder of the test data
         data : dict
-            The corpus where keys are file paths and values are the file contents.
+            The corpus where keys are file paths and values are the file
+            contents. Empty in streaming mode.
         """
         self.dataset_name = path.name
-        self.data = self.crawl_markdown_files(path)
+        self.root = path
+        self.streaming = streaming
+        self.read_workers = read_workers
+        self.data = {} if streaming else self.crawl_markdown_files(path)
 
     def crawl_markdown_files(self, root_dir):
         """
@@ -51,14 +65,52 @@ class CorpusData:
         results = {}
 
         for path in Path(root_dir).rglob("*.md"):
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    results[str(path)] = f.read()
-            except Exception as e:
-                print(f"Error reading {path}: {e}")
+            text = self._read_file(path)
+            if text is not None:
+                results[str(path)] = text
 
         return results
 
+    def iter_documents(self):
+        """
+        Yields `(file path, contents)` for every markdown file in the corpus.
+
+        In streaming mode, files are read by a pool of `read_workers`
+        threads, at most twice that many ahead of the consumer, and yielded
+        in the same order `crawl_markdown_files` would store them.
+
+        Yields
+        ------
+        tuple[str, str]
+            The file path and its contents.
+        """
+        if not self.streaming:
+            yield from self.data.items()
+            return
+
+        paths = Path(self.root).rglob("*.md")
+        with ThreadPoolExecutor(max_workers=self.read_workers) as pool:
+            pending = deque()
+            for path in paths:
+                pending.append((path, pool.submit(self._read_file, path)))
+                if len(pending) >= 2 * self.read_workers:
+                    yield from self._ready_document(*pending.popleft())
+            while pending:
+                yield from self._ready_document(*pending.popleft())
+
+    def _ready_document(self, path, future):
+        text = future.result()
+        if text is not None:
+            yield str(path), text
+
+    def _read_file(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+            return None
+
     def find_passage(self, file_name: str, char_range: list) -> str:
         """
         Retrieve a passage from the corpus.
@@ -84,4 +136,5 @@ class CorpusData:
         """
         start_char = char_range[0]
         end_char = char_range[1]
-        return self.data.get(file_name)[start_char:end_char]
+        text = self._read_file(file_name) if self.streaming else self.data.get(file_name)
+        return text[start_char:end_char]
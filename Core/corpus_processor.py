@@ -1,29 +1,95 @@
 from pathlib import Path
 import hashlib
 import json
+import multiprocessing
 import os
 import unicodedata
 import re
+import shutil
 import time
-import hashlib
-from config import PROCESSED_DATA_PATH
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import CORPORA_PATH, PROCESSED_DATA_PATH
 from pathlib import Path
-import spacy
 from Core.tokenizer import Tokenizer
-from Core.splitter import TextSplitter
+from Core.splitter import TextSplitter, load_sentence_pipeline
+from Core.chunk_store import ChunkStore, ChunkStoreBuilder
+from Core.spill import TokenListReader, TokenListWriter
+from Core.pipeline import BackgroundStage, batched, ordered_map
+from Core.generations import current_dir, generation_dir, new_generation_id, prune, publish
+from Core.config import EMBEDDING_BATCH_SIZE
+from factories.vector_backend_factory import DEFAULT_VECTOR_BACKEND
+
+
+# Per-process state of the preprocessing workers, set by `_init_worker`
+_worker_splitter = None
+_worker_tokenizer = None
+
+
+def _init_worker(split_methods, segmentation_mode):
+    global _worker_splitter, _worker_tokenizer
+    nlp = load_sentence_pipeline(segmentation_mode) if "by_sentence" in split_methods else None
+    _worker_splitter = TextSplitter(methods=split_methods, nlp=nlp)
+    _worker_tokenizer = Tokenizer()
+    _worker_tokenizer.track_new_entries = True
+
+
+def _split_and_tokenize(documents):
+    """
+    Splits and tokenizes a batch of documents in a worker process.
+
+    Also returns the words this worker lemmatized for the first time, so
+    the parent's lemma table covers the whole corpus.
+    """
+    results = []
+    for chunks in _worker_splitter.split_many(documents, batch_size=len(documents)):
+        results.append((chunks, _worker_tokenizer.tokenize_many(chunk["text"] for chunk in chunks)))
+    return results, _worker_tokenizer.take_new_entries()
+
+
+def vector_backend_config(config):
+    """
+    The vector backend a config builds. Annoy takes its tree count from the
+    `annoy_trees` key unless the backend config sets `n_trees` itself.
+    """
+    backend_config = dict(config.get("vector_backend") or DEFAULT_VECTOR_BACKEND)
+    if backend_config.get("type", DEFAULT_VECTOR_BACKEND["type"]) == "annoy" and "annoy_trees" in config:
+        backend_config.setdefault("n_trees", config["annoy_trees"])
+    return backend_config
 
 
 class CorpusProcessor:
-    def __init__(self, corpus, config, dataset_name, embedding_manager, keyword_manager, testing=False):
+    def __init__(
+        self, corpus, config, dataset_name, embedding_manager, keyword_manager, testing=False, corpus_name=None,
+        seed_dir=None,
+    ):
+        """
+        Args:
+            corpus_name (str, optional): Writes the build to
+                `ProcessedData/Corpora/<corpus_name>` so it can be served
+                next to other corpora. Defaults to the production index.
+            seed_dir (Path, optional): Another processed corpus whose
+                published build is reused for unchanged files, instead of
+                the previous build in the output directory. Must have the
+                same split methods and embedding model.
+        """
         self._corpus = corpus
         self._config = config
         self.dataset_name = dataset_name
         self.embedding_manager = embedding_manager
         self.keyword_manager = keyword_manager
         self.testing = testing
+        self._seed_dir = seed_dir
 
         self._tokenizer = Tokenizer()
-        self.nlp = spacy.load("en_core_web_sm")
+        self._segmentation_config = config.get("sentence_segmentation", {})
+        self._preprocessing_config = config.get("preprocessing", {})
+        self._workers = self._preprocessing_config.get("workers", 1)
+        # With worker processes, each worker loads its own pipeline
+        self.nlp = (
+            load_sentence_pipeline(self._segmentation_config.get("mode", "parser"))
+            if "by_sentence" in config["split_methods"] and self._workers <= 1 else None
+        )
         self.text_splitter = TextSplitter(
             methods=config["split_methods"], nlp=self.nlp
         )
@@ -31,13 +97,16 @@ class CorpusProcessor:
         if testing:
             self.processed_corpus_id = self.generate_processed_data_identifier()
             self.processed_data_dir = PROCESSED_DATA_PATH / Path("Testing") / self.processed_corpus_id
+        elif corpus_name is not None:
+            self.processed_corpus_id = None
+            self.processed_data_dir = CORPORA_PATH / corpus_name
         else:
             self.processed_corpus_id = None  # Not needed for production
             self.processed_data_dir = PROCESSED_DATA_PATH / Path("Production")  # Always the same
 
     def process(self):
         """Processes the corpus and saves the results."""
-        if self.testing and self.processed_data_dir.exists():
+        if self.testing and (current_dir(self.processed_data_dir) / "metadata.json").exists():
             print("Test embeddings already exist. Skipping processing.")
             return self.processed_corpus_id
 
@@ -45,63 +114,348 @@ class CorpusProcessor:
         return self._encode_corpus()
 
     def _encode_corpus(self):
-        """Handles tokenization, embedding generation, and saving."""
-        tokenized_chunks = []
-        id_mapping = {}
+        """
+        Handles tokenization, embedding generation, and saving.
+
+        Documents stream through a generator pipeline (read -> split ->
+        tokenize -> embed), so only a bounded window of documents and chunks
+        is in memory at a time. Token lists and chunk metadata are spilled
+        to a staging directory as they are produced, and chunk texts are
+        embedded every `ingestion.embedding_window` chunks.
+
+        With `preprocessing.workers` > 1, splitting and tokenization run in
+        a process pool and embedding runs on its own thread, connected by
+        bounded queues, so the stages overlap. Chunk ids are assigned in
+        corpus order whichever worker finishes first.
+
+        If a previous build with the same split methods and embedding model
+        exists in the output directory, its manifest is used to reuse the
+        chunks, tokens and embeddings of every file that has not changed.
+        Only added or modified files are split and embedded; chunks of
+        deleted files are dropped.
+
+        Every build is written to a new generation directory and published
+        by atomically pointing the corpus's `CURRENT` file at it, so the
+        previous build stays intact for servers still reading it. A build
+        that fails deletes its generation directory.
+        """
+        generation = new_generation_id()
+        output_dir = generation_dir(self.processed_data_dir, generation)
+        try:
+            self._build_generation(generation, output_dir)
+        except BaseException:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            raise
+
+        publish(self.processed_data_dir, generation)
+        prune(self.processed_data_dir, keep=self._config.get("generations", {}).get("keep", 2))
+        return self.processed_corpus_id if self.testing else None  # Return for testing mode
+
+    def _build_generation(self, generation, output_dir):
+        """Builds the corpus into the unpublished generation directory `output_dir`."""
+        ingestion_config = self._config.get("ingestion", {})
+        embedding_window = ingestion_config.get("embedding_window", 4096)
+        embedding_batch_size = self._config.get("embedding_batch_size", EMBEDDING_BATCH_SIZE)
+
+        staging_dir = output_dir / "staging"
+        tokenized_chunks = TokenListWriter(staging_dir / "tokenized_chunks")
+        chunk_store = ChunkStoreBuilder(
+            spill_dir=staging_dir / "chunk_store",
+            store_text=self._config.get("chunk_store", {}).get("store_text", False),
+        )
+        chunk_ids = []
+        chunk_texts = []
+        manifest_files = {}
+        file_counts = {"reused": 0, "processed": 0}
+
+        # Selects the backend before the previous build's index is loaded
+        self.embedding_manager.reset(vector_backend_config(self._config), build_dir=staging_dir)
+        previous = self._load_previous_build()
+        previous_files = previous["manifest"]["files"] if previous else {}
+
+        # Only this stage touches the vector index, so embedding overlaps
+        # with splitting and tokenization of the next documents
+        embedding_stage = BackgroundStage(
+            "embedding", queue_size=self._preprocessing_config.get("queue_size", 4)
+        )
 
         chunk_id_counter = 0
         start_time = time.perf_counter()
 
-        for doc_id, doc_text in self._corpus.data.items():
-            chunks = self.text_splitter.split(doc_text)
+        try:
+            for doc_id, previous_entry, file_state, chunks, chunk_tokens in self._split_documents(previous_files):
+                first_chunk_id = chunk_id_counter
 
-            for chunk in chunks:
-                chunk_text = chunk["text"]
-                self.embedding_manager.generate_and_store_embedding(chunk_id_counter, chunk_text)
+                if chunks is None:
+                    old_ids = range(*previous_entry["chunk_ids"])
+                    for old_id in old_ids:
+                        # The file is unchanged, so its text is only read if it is stored
+                        old_chunk = (
+                            previous["chunk_store"].get(old_id) if chunk_store.store_text
+                            else previous["chunk_store"].get_metadata(old_id)
+                        )
+                        chunk_store.add(
+                            doc_id,
+                            old_chunk.get("text"),
+                            old_chunk["char_range"],
+                            old_chunk["splitting_method"],
+                            old_chunk["granularity"],
+                        )
+                        tokenized_chunks.append(previous["tokenized_chunks"].get(old_id))
+                        chunk_id_counter += 1
+                    embedding_stage.submit(
+                        self.embedding_manager.store_embeddings,
+                        range(first_chunk_id, chunk_id_counter),
+                        [previous["vector_index"].get_vector(old_id) for old_id in old_ids],
+                    )
 
-                id_mapping[chunk_id_counter] = {
-                    "location": doc_id,
-                    "text": chunk_text,
-                    "char_range": chunk["range"],
-                    "splitting_method": chunk["method"]
-                }
+                    file_counts["reused"] += 1
+                    manifest_files[doc_id] = {**file_state, "chunk_ids": [first_chunk_id, chunk_id_counter]}
+                    continue
 
-                # Tokenized chunks will be used to create bm25 index downstream
-                tokenized_chunk = self._tokenizer.tokenize(
-                    chunk_text
-                )
-                tokenized_chunks.append(tokenized_chunk)
+                for chunk, tokenized_chunk in zip(chunks, chunk_tokens):
+                    # Embedded in batches once a window of chunks has been collected
+                    chunk_ids.append(chunk_id_counter)
+                    chunk_texts.append(chunk["text"])
 
-                chunk_id_counter += 1
+                    chunk_store.add(doc_id, chunk["text"], chunk["range"], chunk["method"], chunk.get("granularity"))
+
+                    # Tokenized chunks will be used to create bm25 index downstream
+                    tokenized_chunks.append(tokenized_chunk)
+
+                    chunk_id_counter += 1
+
+                if len(chunk_ids) >= embedding_window:
+                    embedding_stage.submit(
+                        self.embedding_manager.generate_and_store_embeddings,
+                        chunk_ids, chunk_texts, embedding_batch_size,
+                    )
+                    chunk_ids, chunk_texts = [], []
+
+                file_counts["processed"] += 1
+                manifest_files[doc_id] = {**file_state, "chunk_ids": [first_chunk_id, chunk_id_counter]}
+
+            embedding_stage.submit(
+                self.embedding_manager.generate_and_store_embeddings,
+                chunk_ids, chunk_texts, embedding_batch_size,
+            )
+        finally:
+            # Vectors of reused files were copied before being submitted
+            if previous is not None:
+                previous["vector_index"].unload()
+                previous["tokenized_chunks"].close()
+            # Also waits for the embedding thread if splitting failed
+            embedding_stage.close()
+
+        file_counts["deleted"] = len(set(previous_files) - set(manifest_files))
+        print(
+            f"Reused {file_counts['reused']} unchanged files, processed {file_counts['processed']}, "
+            f"dropped {file_counts['deleted']} deleted."
+        )
 
         end_time = time.perf_counter()
         processing_time = end_time - start_time
 
         metadata = {
+            # Identifies this build, so query caches never serve results
+            # computed against a previous index
+            "generation": generation,
             "dataset_name": self.dataset_name,
             "processing_time": processing_time,
             "config": self._config,
+            "files": file_counts,
+            # Tells the QueryRunner how to open the vector index
+            "vector_backend": self.embedding_manager.backend_config,
         }
+        manifest = {"build_settings": self._build_settings(), "files": manifest_files}
 
-        self._save_results(tokenized_chunks, id_mapping, metadata)
-        return self.processed_corpus_id if self.testing else None  # Return for testing mode
+        self._save_results(output_dir, tokenized_chunks, chunk_store, metadata, manifest)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _split_documents(self, previous_files):
+        """
+        Streams the corpus through change detection and the splitter.
+
+        Yields `(doc_id, previous_entry, file_state, chunks, tokens)` in
+        corpus order, with one token list per chunk. `chunks` and `tokens`
+        are None for files unchanged since the previous build; their text is
+        dropped immediately. Changed files are split in batches, so only a
+        bounded number of documents is held in memory at a time.
+        """
+        pending = deque()
+
+        def changed_documents():
+            for doc_id, doc_text in self._corpus.iter_documents():
+                previous_entry = previous_files.get(doc_id)
+                file_state = self._file_state(doc_id, doc_text, previous_entry)
+                unchanged = previous_entry is not None and previous_entry["hash"] == file_state["hash"]
+                pending.append((doc_id, previous_entry, file_state, unchanged))
+                if not unchanged:
+                    yield doc_text
 
-    def _save_results(self, tokenized_chunks, id_mapping, metadata):
-        """Saves embeddings, metadata, and keyword index."""
-        self.processed_data_dir.mkdir(parents=True, exist_ok=True)
+        split_results = (
+            self._split_parallel(changed_documents()) if self._workers > 1
+            else self._split_serial(changed_documents())
+        )
+
+        # Results come back in document order; unchanged files queued ahead
+        # of a changed one are passed through first, so chunk ids stay
+        # sequential in corpus order.
+        for chunks, tokens in split_results:
+            while True:
+                doc_id, previous_entry, file_state, unchanged = pending.popleft()
+                if not unchanged:
+                    break
+                yield doc_id, previous_entry, file_state, None, None
+            yield doc_id, previous_entry, file_state, chunks, tokens
 
-        self.embedding_manager.save_embeddings(self.processed_data_dir)
-        self.keyword_manager.save_index(tokenized_chunks, self.processed_data_dir)
-        self._save_json("id_mapping.json", id_mapping)
-        self._save_json("metadata.json", metadata)
+        for doc_id, previous_entry, file_state, _ in pending:
+            yield doc_id, previous_entry, file_state, None, None
+
+    def _split_serial(self, documents):
+        """Yields `(chunks, tokens)` per document, splitting in this process."""
+        split_results = self.text_splitter.split_many(
+            documents,
+            batch_size=self._segmentation_config.get("batch_size", 64),
+            n_process=self._segmentation_config.get("n_process", 1),
+        )
+        for chunks in split_results:
+            yield chunks, self._tokenizer.tokenize_many(chunk["text"] for chunk in chunks)
+
+    def _split_parallel(self, documents):
+        """
+        Yields `(chunks, tokens)` per document, splitting in a process pool.
+
+        Documents are sent to the workers in batches of
+        `sentence_segmentation.batch_size`. At most `preprocessing.queue_size`
+        batches per worker are in flight, and results are yielded in
+        submission order.
+        """
+        batch_size = self._segmentation_config.get("batch_size", 64)
+        max_pending = self._workers * self._preprocessing_config.get("queue_size", 4)
+        # Spawned rather than forked: this process already runs the
+        # embedding and reader threads and has the model loaded
+        with ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._config["split_methods"], self._segmentation_config.get("mode", "parser")),
+        ) as pool:
+            for results, lemma_entries in ordered_map(
+                pool, _split_and_tokenize, batched(documents, batch_size), max_pending
+            ):
+                self._tokenizer.update_cache(lemma_entries)
+                yield from results
+
+    def _build_settings(self):
+        """Config fields that change the chunks, tokens or embeddings of a file."""
+        return {
+            "split_methods": self._config["split_methods"],
+            "embedding_model": self._config["embedding_model"],
+        }
+
+    def _file_state(self, doc_id, doc_text, previous_entry):
+        """
+        Returns the manifest fields used to detect changes to a file.
+
+        The content hash is only recomputed when the file's mtime or size
+        differs from the previous build.
+        """
+        stat = os.stat(doc_id)
+        if (
+            previous_entry is not None
+            and previous_entry["mtime"] == stat.st_mtime
+            and previous_entry["size"] == stat.st_size
+        ):
+            content_hash = previous_entry["hash"]
+        else:
+            content_hash = hashlib.sha1(doc_text.encode("utf-8")).hexdigest()
+        return {"hash": content_hash, "mtime": stat.st_mtime, "size": stat.st_size}
 
-    def _save_json(self, filename, data):
-        path = self.processed_data_dir / filename
+    def _load_previous_build(self):
+        """
+        Loads the artifacts of the published build in the output directory,
+        or in the seed directory if one was given.
+
+        Returns None if there is no usable previous build, in which case the
+        whole corpus is processed.
+        """
+        previous_dir = current_dir(self._seed_dir or self.processed_data_dir)
+        manifest_path = previous_dir / "manifest.json"
+        if not manifest_path.exists():
+            return None
+
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("build_settings") != self._build_settings():
+            print("Build settings changed since last run. Reprocessing full corpus.")
+            return None
+
+        # Vectors are copied out of the previous index, which may use another backend
+        with open(previous_dir / "metadata.json", "r") as f:
+            previous_backend = json.load(f).get("vector_backend")
+        vector_index = self.embedding_manager.load_embeddings(previous_dir, previous_backend)
+        if vector_index is None:
+            return None
+
+        tokens_path = previous_dir / "tokenized_chunks"
+        if not TokenListReader.exists(tokens_path):
+            vector_index.unload()
+            return None
+
+        # The previous build is never modified, so it can stay memory-mapped
+        chunk_store = ChunkStore.load(previous_dir / "chunk_store")
+        tokenized_chunks = TokenListReader(tokens_path)
+        # Keeps the words of reused files in the lemma table saved with this build
+        self._tokenizer.load_lemma_table(previous_dir / "lemma_table.json")
+
+        return {
+            "manifest": manifest,
+            "vector_index": vector_index,
+            "chunk_store": chunk_store,
+            "tokenized_chunks": tokenized_chunks,
+        }
+
+    def _save_results(self, output_dir, tokenized_chunks, chunk_store, metadata, manifest):
+        """
+        Saves embeddings, chunk metadata, keyword index and the build
+        manifest to the generation directory `output_dir`.
+
+        Token lists and chunk metadata are moved or streamed out of their
+        staging files rather than loaded into memory.
+        """
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        # Item count and timings of the vector index build
+        metadata["vector_index_build"] = self.embedding_manager.save_embeddings(output_dir)
+
+        tokenized_chunks.close()
+        tokens_path = output_dir / "tokenized_chunks"
+        for suffix in (".jsonl", ".offsets.npy"):
+            os.replace(tokenized_chunks.base_path.with_suffix(suffix), tokens_path.with_suffix(suffix))
+
+        tokens = TokenListReader(tokens_path)
+        self.keyword_manager.save_index(tokens, output_dir)
+        tokens.close()
+        chunk_store.save(output_dir / "chunk_store")
+        # Lets query-time tokenization skip lemmatizing words seen at index time
+        self._tokenizer.save_lemma_table(output_dir / "lemma_table.json")
+        self._save_json(output_dir, "metadata.json", metadata)
+        self._save_json(output_dir, "manifest.json", manifest)
+
+    def _save_json(self, directory, filename, data, indent=4):
+        path = directory / filename
         with open(path, "w") as f:
-            json.dump(data, f, indent=4)
+            json.dump(data, f, indent=indent)
 
     def generate_processed_data_identifier(self):
         """Generates a unique identifier for the processed corpus (for testing mode)."""
-        key_settings = (self.dataset_name, self._config["split_methods"], self._config["embedding_model"])
+        key_settings = (
+            self.dataset_name,
+            self._config["split_methods"],
+            self._config["embedding_model"],
+            self._config.get("sentence_segmentation", {}),
+            vector_backend_config(self._config),
+        )
         unique_string = "__".join(map(str, key_settings))
         return hashlib.md5(unique_string.encode()).hexdigest()
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed store of chunk embeddings.
+
+    Vectors are keyed by a hash of the embedding model name and the
+    normalized chunk text, so the same sentence produced by two preprocessing
+    runs (or two grid search configs) is only ever encoded once.
+
+    On disk, each model gets its own directory holding:
+        - `vectors.f32`: an append-only file of float32 rows, read through a
+          memory map.
+        - `index.npy`: a compact record array of (key digest, row, last used).
+
+    When the number of live entries exceeds `max_entries`, the least
+    recently used entries are evicted and the vector file is compacted once
+    it holds more dead rows than live ones.
+    """
+
+    # Keys are raw MD5 digests, so they are stored as opaque bytes: an "S16"
+    # field would strip trailing NUL bytes on read.
+    _INDEX_DTYPE = np.dtype([("key", "V16"), ("row", "<i8"), ("last_used", "<i8")])
+
+    def __init__(self, cache_dir: Path, model_name: str, dim=384, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Initialize the EmbeddingCache, loading any entries already on disk.
+
+        Parameters
+        ----------
+        cache_dir : Path
+            Root directory of the cache. A subdirectory is created per model.
+        model_name : str
+            Name of the embedding model the vectors were produced with.
+        dim : int
+            Dimensionality of the stored vectors.
+        max_entries : int
+            Maximum number of vectors kept before eviction kicks in.
+        """
+        self._model_name = model_name
+        self._dim = dim
+        self._max_entries = max_entries
+
+        self._dir = Path(cache_dir) / model_name
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self._dir / "vectors.f32"
+        self._index_path = self._dir / "index.npy"
+
+        self._entries = {}  # key digest -> [row, last_used]
+        self._clock = 0
+        self._n_rows = 0
+        self._vectors = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, text: str) -> bytes:
+        """Returns the cache key for a chunk of text."""
+        normalized = unicodedata.normalize("NFC", text).strip()
+        return hashlib.md5(f"{self._model_name}\x00{normalized}".encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """
+        Look up the cached vector for each text.
+
+        Returns
+        -------
+        list
+            One entry per text: a float32 vector on a hit, None on a miss.
+        """
+        results = []
+        for text in texts:
+            entry = self._entries.get(self.key(text))
+            if entry is None:
+                self.misses += 1
+                results.append(None)
+                continue
+
+            self.hits += 1
+            self._clock += 1
+            entry[1] = self._clock
+            results.append(np.array(self._vector_rows()[entry[0]]))
+        return results
+
+    def put_many(self, texts, vectors):
+        """Appends vectors for texts that are not cached yet."""
+        new_keys = []
+        new_vectors = []
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            if key in self._entries:
+                continue
+            new_keys.append(key)
+            new_vectors.append(vector)
+
+        if not new_keys:
+            return
+
+        block = np.asarray(new_vectors, dtype=np.float32).reshape(-1, self._dim)
+        with open(self._vectors_path, "ab") as f:
+            f.write(block.tobytes())
+
+        for key in new_keys:
+            self._clock += 1
+            self._entries[key] = [self._n_rows, self._clock]
+            self._n_rows += 1
+        self._vectors = None  # Remap on next read to pick up the new rows
+
+        if len(self._entries) > self._max_entries:
+            self._evict()
+
+    def flush(self):
+        """Writes the key index to disk."""
+        index = np.empty(len(self._entries), dtype=self._INDEX_DTYPE)
+        for i, (key, (row, last_used)) in enumerate(self._entries.items()):
+            index[i] = (key, row, last_used)
+
+        tmp_path = self._index_path.with_suffix(".tmp.npy")
+        np.save(tmp_path, index)
+        os.replace(tmp_path, self._index_path)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._n_rows * self._dim * 4,
+        }
+
+    def _load(self):
+        if self._vectors_path.exists():
+            self._n_rows = self._vectors_path.stat().st_size // (self._dim * 4)
+
+        if not self._index_path.exists():
+            return
+
+        index = np.load(self._index_path)
+        for key, row, last_used in index:
+            if row < self._n_rows:  # Ignore rows lost to an interrupted write
+                # Pad keys read from indexes written with the old "S16" field
+                self._entries[bytes(key).ljust(16, b"\x00")] = [int(row), int(last_used)]
+        if len(index):
+            self._clock = int(index["last_used"].max())
+
+    def _vector_rows(self):
+        if self._vectors is None:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._n_rows, self._dim)
+            )
+        return self._vectors
+
+    def _evict(self):
+        overflow = len(self._entries) - self._max_entries
+        by_age = sorted(self._entries.items(), key=lambda item: item[1][1])
+        for key, _ in by_age[:overflow]:
+            del self._entries[key]
+        self.evictions += overflow
+        logger.info(f"Evicted {overflow} entries from embedding cache for {self._model_name}")
+
+        if self._n_rows > 2 * len(self._entries):
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the vector file so it only holds live rows."""
+        rows = self._vector_rows()
+        tmp_path = self._vectors_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            for new_row, entry in enumerate(self._entries.values()):
+                f.write(np.asarray(rows[entry[0]], dtype=np.float32).tobytes())
+                entry[0] = new_row
+
+        self._vectors = None
+        del rows
+        os.replace(tmp_path, self._vectors_path)
+        self._n_rows = len(self._entries)
+        self.flush()
@@ -1,36 +1,150 @@
-from annoy import AnnoyIndex
+import logging
+import time
 from pathlib import Path
 from factories.embedding_model_factory import EmbeddingModelFactory
+from factories.vector_backend_factory import DEFAULT_VECTOR_BACKEND, VectorBackendFactory
+from Core.config import EMBEDDING_BATCH_SIZE, EMBEDDING_DIM
 
 PATH_TO_EMBEDDINGS_BASE = Path(
     "C:\\Users\\Djhay\\OneDrive\\Desktop\\Projects\\Hackathon\\Hackathon\\ProcessedData"
 )
 
+logger = logging.getLogger(__name__)
+
 class EmbeddingManager:
-    def __init__(self):
-        self._annoy_index = self._set_up_annoy()
+    def __init__(self, batch_size=EMBEDDING_BATCH_SIZE, model_name="all-MiniLM-L6-v2", cache=None):
+        """
+        Args:
+            batch_size (int): Default number of chunks per forward pass.
+            model_name (str): Name of the SentenceTransformer model to use.
+            cache (EmbeddingCache, optional): Persistent store of previously
+                computed vectors. Only cache misses are sent to the model.
+        """
+        self._backend_factory = VectorBackendFactory()
+        self.backend_config = DEFAULT_VECTOR_BACKEND
+        self._vector_index = self._set_up_backend()
+        self._batch_size = batch_size
+        self.model_name = model_name
+        self._cache = cache
         emf = EmbeddingModelFactory()
-        self._model = emf.get_model("all-MiniLM-L6-v2")
+        self._model = emf.get_model(model_name)
+
+    def reset(self, backend_config=None, build_dir=None):
+        """
+        Starts a fresh vector index, discarding any items added so far.
+
+        Args:
+            backend_config (dict, optional): The vector backend to build,
+                e.g. `{"type": "numpy"}`. Defaults to Annoy.
+            build_dir (Path, optional): Scratch directory where backends
+                that can build on disk (Annoy with `on_disk_build`) keep
+                the index while it is built.
+        """
+        self.backend_config = backend_config or DEFAULT_VECTOR_BACKEND
+        self._vector_index = self._set_up_backend()
+        if build_dir is not None:
+            self._vector_index.use_build_dir(build_dir)
 
-    def _set_up_annoy(self):
-        embedding_dim = 384  # TODO: Take this out
-        metric = 'angular'  # TODO: Take this out
-        annoy_index = AnnoyIndex(embedding_dim, metric)
-        return annoy_index
+    def _set_up_backend(self):
+        return self._backend_factory.create(self.backend_config, EMBEDDING_DIM)
 
     def save_embeddings(self, processed_data_dir):
         """
-        Saves Annoy index to disk, creating the directory if it does not exist.
+        Builds the vector index and saves it to `processed_data_dir`.
+
+        Returns:
+            dict: Item count, and build and save times in seconds.
         """
-        embedding_path = processed_data_dir / "embeddings.ann"
+        items = len(self._vector_index)
+        logger.info(f"Building {self.backend_config.get('type', DEFAULT_VECTOR_BACKEND['type'])} vector index over {items} items")
+        start_time = time.perf_counter()
+        self._vector_index.build()
+        build_time = time.perf_counter() - start_time
+        logger.info(f"Built vector index in {build_time:.2f}s, saving")
 
-        n_trees = 10  # TODO: Pass in dynamically
-        self._annoy_index.build(n_trees=n_trees)
-        self._annoy_index.save(str(embedding_path))
+        start_time = time.perf_counter()
+        self._vector_index.save(processed_data_dir)
+        save_time = time.perf_counter() - start_time
+
+        if self._cache is not None:
+            self._cache.flush()
+            logger.info(f"Embedding cache stats: {self._cache.stats()}")
+
+        return {
+            "items": items,
+            "build_seconds": build_time,
+            "save_seconds": save_time,
+        }
+
+
+    def load_embeddings(self, processed_data_dir, backend_config=None):
+        """
+        Loads a previously saved index, or returns None if there is none.
+
+        Args:
+            backend_config (dict, optional): The backend the index was built
+                with. Defaults to the current backend.
+        """
+        backend_config = backend_config or self.backend_config
+        backend_class = self._backend_factory.get_backend_class(backend_config)
+        if not backend_class.exists(processed_data_dir):
+            return None
 
-        return str(embedding_path)
+        return self._backend_factory.load(backend_config, processed_data_dir, EMBEDDING_DIM)
 
+    def store_embedding(self, id, embedding):
+        """Adds an already computed embedding to the vector index."""
+        self._vector_index.add(id, embedding)
+
+    def store_embeddings(self, ids, embeddings):
+        """Adds already computed embeddings to the vector index."""
+        self._vector_index.add_many(ids, embeddings)
 
     def generate_and_store_embedding(self, id, split):
-        embedding = self._model.encode(split)
-        self._annoy_index.add_item(id, embedding)
+        embedding = self._embed([split])[0]
+        self._vector_index.add(id, embedding)
+
+    def generate_and_store_embeddings(self, ids, splits, batch_size=None):
+        """
+        Embeds many chunks and adds them to the vector index.
+
+        Chunks are sorted by length and encoded in buckets of `batch_size`,
+        so each forward pass pads its inputs to a similar length.
+
+        Args:
+            ids (list[int]): Item ids, one per split.
+            splits (list[str]): Chunk texts to embed.
+            batch_size (int, optional): Chunks per forward pass. Defaults to
+                the batch size given at construction.
+        """
+        if len(ids) != len(splits):
+            raise ValueError("ids and splits must have the same length.")
+
+        self._vector_index.add_many(ids, self._embed(splits, batch_size))
+
+    def _embed(self, splits, batch_size=None):
+        """
+        Returns one embedding per split, in input order.
+
+        Cached vectors are reused; the remaining splits are sorted by length
+        and encoded in buckets of `batch_size`.
+        """
+        batch_size = batch_size or self._batch_size
+        embeddings = (
+            self._cache.get_many(splits) if self._cache is not None
+            else [None] * len(splits)
+        )
+
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        misses.sort(key=lambda i: len(splits[i]))
+
+        for start in range(0, len(misses), batch_size):
+            bucket = misses[start:start + batch_size]
+            bucket_texts = [splits[i] for i in bucket]
+            encoded = self._model.encode(bucket_texts, batch_size=len(bucket))
+            for i, embedding in zip(bucket, encoded):
+                embeddings[i] = embedding
+            if self._cache is not None:
+                self._cache.put_many(bucket_texts, encoded)
+
+        return embeddings
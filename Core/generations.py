@@ -0,0 +1,116 @@
+"""
+Versioned build directories for a processed corpus.
+
+Each build of a corpus is written to its own directory,
+`<corpus_dir>/generations/<generation>`, and never modified once
+published. The `CURRENT` file in the corpus directory names the published
+generation; it is replaced atomically, so readers always see either the old
+build or the new one in full. Corpora built before generations existed
+keep their files directly in the corpus directory and have no `CURRENT`.
+
+Query caches are mutable, so they are persisted outside the build, under
+`<corpus_dir>/query_cache/<generation>`, and deleted along with their
+generation.
+"""
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+GENERATIONS_DIR = "generations"
+CURRENT_FILE = "CURRENT"
+QUERY_CACHE_DIR = "query_cache"
+
+
+def new_generation_id():
+    """A unique generation id that sorts by creation time."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def generation_dir(corpus_dir, generation):
+    return Path(corpus_dir) / GENERATIONS_DIR / generation
+
+
+def current_generation(corpus_dir):
+    """The published generation of a corpus, or None if it has none."""
+    try:
+        return (Path(corpus_dir) / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_dir(corpus_dir):
+    """
+    The directory holding the published build of a corpus: its current
+    generation, or the corpus directory itself for a pre-generation build.
+    """
+    generation = current_generation(corpus_dir)
+    return generation_dir(corpus_dir, generation) if generation is not None else Path(corpus_dir)
+
+
+def query_cache_dir(corpus_dir, generation):
+    """The directory query caches of a generation are persisted to."""
+    path = Path(corpus_dir) / QUERY_CACHE_DIR
+    return path / generation if generation is not None else path
+
+
+def publish(corpus_dir, generation):
+    """Atomically makes `generation` the current build of a corpus."""
+    corpus_dir = Path(corpus_dir)
+    tmp_path = corpus_dir / f"{CURRENT_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, corpus_dir / CURRENT_FILE)
+    logger.info(f"Published generation {generation} of {corpus_dir}")
+
+
+def is_complete(directory):
+    """Whether a build directory holds a finished build; aborted builds only hold `staging`."""
+    return (Path(directory) / "metadata.json").exists()
+
+
+def prune(corpus_dir, keep=2):
+    """
+    Deletes all but the `keep` newest complete generations, never the
+    current one, and the incomplete generations older than the current one.
+
+    Only complete generations count toward `keep`, so the generation
+    before the current one is kept by default even if a build crashed in
+    between, and a server still draining queries against it keeps its
+    files. Incomplete generations newer than the current one may be
+    builds still in progress and are left alone.
+    """
+    generations_path = Path(corpus_dir) / GENERATIONS_DIR
+    if not generations_path.is_dir():
+        return
+    current = current_generation(corpus_dir)
+    generations = sorted(path.name for path in generations_path.iterdir() if path.is_dir())
+    complete = [generation for generation in generations if is_complete(generations_path / generation)]
+    stale = complete[:-keep] if keep > 0 else complete
+    if current is not None:
+        stale += [
+            generation for generation in generations
+            if generation < current and generation not in complete
+        ]
+    for generation in sorted(stale):
+        if generation == current:
+            continue
+        try:
+            shutil.rmtree(generations_path / generation)
+        except OSError:
+            # Still memory-mapped by a running server on some platforms
+            logger.warning(f"Could not delete old generation {generation}; will retry after the next build")
+
+    # Query caches of deleted generations, including ones saved by a server
+    # that was still serving a generation after it was pruned
+    cache_path = Path(corpus_dir) / QUERY_CACHE_DIR
+    if cache_path.is_dir():
+        for path in cache_path.iterdir():
+            if path.is_dir() and not (generations_path / path.name).is_dir():
+                shutil.rmtree(path, ignore_errors=True)
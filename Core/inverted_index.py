@@ -0,0 +1,441 @@
+import json
+import math
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from Core.spill import ColumnSpill
+
+
+class InvertedIndex:
+    """
+    A BM25 (Okapi) index stored as flat NumPy arrays.
+
+    Postings are laid out CSR-style: the postings of term `t` (its id being
+    its position in the sorted vocabulary) live in `doc_ids[offsets[t]:offsets[t + 1]]`
+    and `tfs[offsets[t]:offsets[t + 1]]`, with doc ids ascending. Scoring a
+    query only reads the postings of the query's terms.
+
+    Scores match `rank_bm25.BM25Okapi`, including its epsilon floor for
+    negative IDFs. The highest score each term contributes to any document
+    is stored alongside its IDF, which `top_k` uses to skip postings that
+    cannot change the top results.
+
+    Saved indexes are a directory of `.npy` files plus a small `meta.json`,
+    and are memory-mapped when loaded.
+    """
+
+    _ARRAYS = ("vocab", "offsets", "doc_ids", "tfs", "idf", "max_scores", "doc_lens", "doc_norms")
+
+    def __init__(self, vocab, offsets, doc_ids, tfs, idf, max_scores, doc_lens, doc_norms, k1, b):
+        """
+        Parameters
+        ----------
+        vocab : np.ndarray
+            Sorted array of every term in the corpus.
+        offsets : np.ndarray
+            int64 array of length len(vocab) + 1 delimiting each term's postings.
+        doc_ids : np.ndarray
+            int32 array of the document id of every posting.
+        tfs : np.ndarray
+            int32 array of the term frequency of every posting.
+        idf : np.ndarray
+            float64 IDF of every term.
+        max_scores : np.ndarray
+            float64 upper bound of every term's contribution to a document score.
+        doc_lens : np.ndarray
+            int32 token count of every document.
+        doc_norms : np.ndarray
+            float32 `k1 * (1 - b + b * doc_len / avgdl)` for every document.
+        k1, b : float
+            BM25 parameters.
+        """
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.idf = idf
+        self.max_scores = max_scores
+        self.doc_lens = doc_lens
+        self.doc_norms = doc_norms
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def n_docs(self):
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, tokenized_chunks, k1=1.5, b=0.75, epsilon=0.25):
+        """
+        Builds an index from a list of token lists, one per chunk.
+        """
+        term_to_id = {}
+        posting_terms = []
+        posting_docs = []
+        posting_tfs = []
+        doc_lens = []
+
+        for doc_id, tokens in enumerate(tokenized_chunks):
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                posting_terms.append(term_to_id.setdefault(term, len(term_to_id)))
+                posting_docs.append(doc_id)
+                posting_tfs.append(tf)
+
+        # Re-number terms so ids follow the sorted vocabulary, which lets
+        # lookups use a binary search instead of a dict at query time.
+        vocab = np.array(sorted(term_to_id), dtype=str)
+        new_ids = np.empty(len(term_to_id), dtype=np.int64)
+        for term, old_id in term_to_id.items():
+            new_ids[old_id] = np.searchsorted(vocab, term)
+
+        terms = new_ids[np.asarray(posting_terms, dtype=np.int64)] if posting_terms else np.empty(0, np.int64)
+        order = np.argsort(terms, kind="stable")  # Keeps doc ids ascending within a term
+        doc_ids = np.asarray(posting_docs, dtype=np.int32)[order]
+        tfs = np.asarray(posting_tfs, dtype=np.int32)[order]
+        df = np.bincount(terms, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        doc_lens = np.asarray(doc_lens, dtype=np.int32)
+        idf = cls._compute_idf(df, len(doc_lens), epsilon)
+        avgdl = doc_lens.mean() if len(doc_lens) else 0.0
+        doc_norms = (k1 * (1 - b + b * doc_lens / max(avgdl, 1e-9))).astype(np.float32)
+
+        posting_weights = idf[terms[order]] * tfs * (k1 + 1) / (tfs + doc_norms[doc_ids])
+        max_scores = (
+            np.maximum.reduceat(posting_weights, offsets[:-1]) if len(posting_weights)
+            else np.empty(0)
+        )
+
+        return cls(vocab, offsets, doc_ids, tfs, idf, max_scores, doc_lens, doc_norms, k1, b)
+
+    @classmethod
+    def build_to_disk(cls, tokenized_chunks, index_dir: Path, k1=1.5, b=0.75, epsilon=0.25,
+                      block_size=50_000):
+        """
+        Builds an index directly into `index_dir` with bounded memory.
+
+        Produces the same index as `build(...).save(index_dir)`, but
+        postings are never collected in memory. A first pass over
+        `tokenized_chunks` counts document frequencies and lengths; a second
+        pass scatters each block of `block_size` chunks into memory-mapped
+        posting arrays at offsets known from the first pass.
+
+        Parameters
+        ----------
+        tokenized_chunks : Iterable[list[str]]
+            Token lists, one per chunk. Iterated twice, so it must be a
+            collection or a re-iterable reader such as `TokenListReader`.
+
+        Returns
+        -------
+        InvertedIndex
+            The saved index, memory-mapped.
+        """
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+
+        df = Counter()
+        doc_lens = ColumnSpill(index_dir / "doc_lens.bin", np.int32)
+        total_len = 0
+        for tokens in tokenized_chunks:
+            df.update(set(tokens))
+            doc_lens.append(len(tokens))
+            total_len += len(tokens)
+
+        vocab = np.array(sorted(df), dtype=str)
+        term_to_id = {term: term_id for term_id, term in enumerate(vocab.tolist())}
+        df = np.fromiter((df[term] for term in term_to_id), dtype=np.int64, count=len(term_to_id))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        n_docs = len(doc_lens)
+        idf = cls._compute_idf(df, n_docs, epsilon)
+        avgdl = total_len / n_docs if n_docs else 0.0
+        doc_lens.save_npy(index_dir / "doc_lens.npy")
+        doc_lens.close()
+        doc_lens = np.load(index_dir / "doc_lens.npy", mmap_mode="r")
+        doc_norms = np.lib.format.open_memmap(
+            index_dir / "doc_norms.npy", mode="w+", dtype=np.float32, shape=(n_docs,)
+        )
+        for start in range(0, n_docs, 1 << 20):
+            block = doc_lens[start:start + (1 << 20)]
+            doc_norms[start:start + len(block)] = k1 * (1 - b + b * block / max(avgdl, 1e-9))
+
+        n_postings = int(offsets[-1])
+        doc_ids = np.lib.format.open_memmap(
+            index_dir / "doc_ids.npy", mode="w+", dtype=np.int32, shape=(n_postings,)
+        )
+        tfs = np.lib.format.open_memmap(
+            index_dir / "tfs.npy", mode="w+", dtype=np.int32, shape=(n_postings,)
+        )
+        max_scores = np.full(len(vocab), -np.inf)
+        cursors = offsets[:-1].copy()
+
+        def scatter(terms, docs, counts):
+            terms = np.asarray(terms, dtype=np.int64)
+            order = np.argsort(terms, kind="stable")  # Keeps doc ids ascending within a term
+            terms = terms[order]
+            docs = np.asarray(docs, dtype=np.int32)[order]
+            counts = np.asarray(counts, dtype=np.int32)[order]
+            block_terms, first, block_df = np.unique(terms, return_index=True, return_counts=True)
+            positions = cursors[terms] + np.arange(len(terms)) - np.repeat(first, block_df)
+            doc_ids[positions] = docs
+            tfs[positions] = counts
+            cursors[block_terms] += block_df
+            weights = idf[terms] * counts * (k1 + 1) / (counts + doc_norms[docs])
+            np.maximum.at(max_scores, terms, weights)
+
+        block = ([], [], [])
+        for doc_id, tokens in enumerate(tokenized_chunks):
+            for term, tf in Counter(tokens).items():
+                block[0].append(term_to_id[term])
+                block[1].append(doc_id)
+                block[2].append(tf)
+            if (doc_id + 1) % block_size == 0 and block[0]:
+                scatter(*block)
+                block = ([], [], [])
+        if block[0]:
+            scatter(*block)
+
+        doc_ids.flush()
+        tfs.flush()
+        doc_norms.flush()
+        del doc_ids, tfs, doc_norms, doc_lens
+
+        for name, array in (("vocab", vocab), ("offsets", offsets), ("idf", idf), ("max_scores", max_scores)):
+            np.save(index_dir / f"{name}.npy", array)
+        with open(index_dir / "meta.json", "w") as f:
+            json.dump({"k1": k1, "b": b, "n_docs": n_docs}, f, indent=4)
+
+        return cls.load(index_dir)
+
+    @staticmethod
+    def _compute_idf(df, n_docs, epsilon):
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+        return idf
+
+    def save(self, index_dir: Path):
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(index_dir / f"{name}.npy", getattr(self, name))
+        with open(index_dir / "meta.json", "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "n_docs": self.n_docs}, f, indent=4)
+
+    @classmethod
+    def load(cls, index_dir: Path, mmap=True):
+        """Loads a saved index, memory-mapping its arrays unless `mmap` is False."""
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", "r") as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(index_dir / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in cls._ARRAYS
+        }
+        return cls(k1=meta["k1"], b=meta["b"], **arrays)
+
+    def term_ids(self, tokens):
+        """
+        Maps query tokens to term ids.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The ids of the distinct known terms and how often each occurs in
+            `tokens`. Unknown tokens are dropped.
+        """
+        counts = Counter(tokens)
+        if not counts or not len(self.vocab):
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+
+        terms = np.array(list(counts), dtype=str)
+        positions = np.searchsorted(self.vocab, terms)
+        positions = np.minimum(positions, len(self.vocab) - 1)
+        known = self.vocab[positions] == terms
+        multiplicity = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        return positions[known].astype(np.int64), multiplicity[known]
+
+    def postings(self, term_id):
+        """Returns the doc ids and BM25 contributions of a term's postings."""
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        doc_ids = self.doc_ids[start:end]
+        tfs = self.tfs[start:end].astype(np.float64)
+        weights = self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self.doc_norms[doc_ids])
+        return doc_ids, weights
+
+    def get_scores(self, tokens):
+        """
+        Scores every document against the query, like `BM25Okapi.get_scores`.
+        """
+        scores = np.zeros(self.n_docs)
+        for term_id, count in zip(*self.term_ids(tokens)):
+            doc_ids, weights = self.postings(term_id)
+            scores[doc_ids] += count * weights
+        return scores
+
+    def search(self, tokens, k):
+        """
+        Returns the top `k` documents for a query.
+
+        Only documents that contain at least one query term are scored, so
+        fewer than `k` results are returned when fewer documents match.
+
+        Returns
+        -------
+        tuple[list[int], list[float]]
+            Document ids and scores, best first.
+        """
+        term_ids, counts = self.term_ids(tokens)
+        if not len(term_ids):
+            return [], []
+
+        doc_ids = []
+        weights = []
+        for term_id, count in zip(term_ids, counts):
+            term_docs, term_weights = self.postings(term_id)
+            doc_ids.append(term_docs)
+            weights.append(count * term_weights)
+
+        candidates, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        return self._top_k(candidates, scores, k)
+
+    def top_k(self, tokens, k):
+        """
+        Returns the exact top `k` documents for a query using MaxScore pruning.
+
+        Terms are processed term-at-a-time in decreasing order of their score
+        upper bound. Once the k-th best partial score exceeds the sum of the
+        upper bounds of the terms still to process, no unseen document can
+        reach the top `k`: the remaining terms are only looked up for the
+        current candidates, and candidates that can no longer reach the
+        threshold are dropped.
+
+        Returns
+        -------
+        tuple[list[int], list[float], int]
+            Document ids and scores, best first, and the number of postings
+            that were scored.
+        """
+        term_ids, counts = self.term_ids(tokens)
+        if not len(term_ids):
+            return [], [], 0
+        if self.idf[term_ids].min() < 0:
+            # Partial scores are only lower bounds when contributions are
+            # non-negative, so fall back to scoring every posting.
+            ids, scores = self.search(tokens, k)
+            return ids, scores, int(sum(self.offsets[t + 1] - self.offsets[t] for t in term_ids))
+
+        upper_bounds = counts * self.max_scores[term_ids]
+        order = np.argsort(-upper_bounds, kind="stable")
+        term_ids, counts, upper_bounds = term_ids[order], counts[order], upper_bounds[order]
+        # remaining[i]: best score a document can still gain after term i
+        remaining = np.append(np.cumsum(upper_bounds[::-1])[::-1][1:], 0.0)
+
+        candidates = np.empty(0, dtype=np.int64)
+        scores = np.empty(0)
+        admitting_new_docs = True
+        postings_evaluated = 0
+
+        for i, (term_id, count) in enumerate(zip(term_ids, counts)):
+            if admitting_new_docs:
+                term_docs, term_weights = self.postings(term_id)
+                postings_evaluated += len(term_docs)
+                candidates, inverse = np.unique(
+                    np.concatenate([candidates, term_docs]), return_inverse=True
+                )
+                scores = np.bincount(
+                    inverse, weights=np.concatenate([scores, count * term_weights])
+                )
+            else:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                term_docs = self.doc_ids[start:end]
+                positions = np.searchsorted(term_docs, candidates)
+                found = positions < len(term_docs)
+                found[found] = term_docs[positions[found]] == candidates[found]
+                matched = candidates[found]
+                tfs = self.tfs[start + positions[found]].astype(np.float64)
+                postings_evaluated += len(matched)
+                scores[found] += count * (
+                    self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self.doc_norms[matched])
+                )
+
+            if len(scores) < k:
+                continue
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            if remaining[i] < threshold:
+                admitting_new_docs = False
+            if not admitting_new_docs:
+                keep = scores + remaining[i] >= threshold
+                candidates, scores = candidates[keep], scores[keep]
+
+        ids, top_scores = self._top_k(candidates, scores, k)
+        return ids, top_scores, postings_evaluated
+
+    def search_many(self, token_lists, k, max_block_bytes=128 << 20):
+        """
+        Returns the top `k` documents for each of many queries.
+
+        Each distinct term's postings are weighted once for the whole batch
+        and scattered into a dense (queries x documents) score matrix, with a
+        matching bool matrix marking the documents a query term occurs in.
+        Both take `n_docs` entries per query, so queries are processed in
+        blocks of as many rows as fit in `max_block_bytes` (at least one).
+        Like `search`, only documents containing a query term are returned.
+
+        Returns
+        -------
+        list[tuple[list[int], list[float]]]
+            Document ids and scores for each query, best first.
+        """
+        queries = [self.term_ids(tokens) for tokens in token_lists]
+        postings = {}
+        for term_ids, _ in queries:
+            for term_id in term_ids:
+                if term_id not in postings:
+                    postings[term_id] = self.postings(term_id)
+
+        results = []
+        # A float64 score and a bool match flag per document and query
+        row_bytes = max(self.n_docs, 1) * (np.dtype(np.float64).itemsize + np.dtype(bool).itemsize)
+        block_size = max(1, max_block_bytes // row_bytes)
+        for block_start in range(0, len(queries), block_size):
+            block = queries[block_start:block_start + block_size]
+
+            # Group the block's rows by term so each term is scattered once
+            rows_by_term = {}
+            for row, (term_ids, counts) in enumerate(block):
+                for term_id, count in zip(term_ids, counts):
+                    rows_by_term.setdefault(term_id, ([], []))
+                    rows_by_term[term_id][0].append(row)
+                    rows_by_term[term_id][1].append(count)
+
+            scores = np.zeros((len(block), self.n_docs))
+            matched = np.zeros((len(block), self.n_docs), dtype=bool)
+            for term_id, (rows, counts) in rows_by_term.items():
+                doc_ids, weights = postings[term_id]
+                rows = np.asarray(rows)
+                scores[rows[:, None], doc_ids] += np.outer(counts, weights)
+                matched[rows[:, None], doc_ids] = True
+
+            for row in range(len(block)):
+                candidates = np.flatnonzero(matched[row])
+                results.append(self._top_k(candidates, scores[row, candidates], k))
+
+        return results
+
+    @staticmethod
+    def _top_k(candidates, scores, k):
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top].tolist(), scores[top].tolist()
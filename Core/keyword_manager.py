@@ -1,17 +1,6 @@
-import pickle
-import re
-import os
-import unicodedata
-import json
 from pathlib import Path
-from rank_bm25 import BM25Okapi
 import logging
-from Core.tokenizer import Tokenizer
-
-import unicodedata
-import re
-import nltk
-from nltk.corpus import stopwords
+from Core.inverted_index import InvertedIndex
 
 
 # Setup logger
@@ -24,27 +13,17 @@ class KeywordManager:
 
     def save_index(self, tokenized_chunks, processed_data_dir):
         """
-        Creates, loads, or caches a BM25 keyword index for the dataset.
+        Builds a BM25 inverted index for the dataset directly on disk.
 
         Args:
-            tokenized_chunks (list): Tokenized text chunks for BM25.
+            tokenized_chunks (Iterable[list[str]]): Tokenized text chunks for
+                BM25. Iterated twice, e.g. a list or a `TokenListReader`.
 
         Returns:
-            BM25Okapi: Precomputed BM25 index.
+            InvertedIndex: Precomputed BM25 index, memory-mapped.
         """
+        index_path = processed_data_dir / "keyword_index"
+        index = InvertedIndex.build_to_disk(tokenized_chunks, index_path)
+        logger.info(f"Saved BM25 index for {self._dataset_name} to {index_path}")
 
-        # Just so we can see what went into bm25
-        testing_dict = {}
-        for i, chunk in enumerate(tokenized_chunks):
-            testing_dict[i] = list(chunk)
-        with open("check_tokenized_chunks.json", "w") as f:
-            json.dump(testing_dict, f, indent=4)
-
-        bm25 = BM25Okapi(tokenized_chunks)
-        index_path = processed_data_dir / "bm25_index.pkl"
-
-        with open(index_path, "wb") as f:
-            pickle.dump(bm25, f)
-            logger.info(f"Saved BM25 index for {self._dataset_name} to {index_path}")
-
-        return bm25
+        return index
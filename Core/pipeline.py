@@ -0,0 +1,72 @@
+import itertools
+import queue
+import threading
+from collections import deque
+
+
+def batched(iterable, size):
+    """Yields lists of at most `size` consecutive items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def ordered_map(executor, fn, items, max_pending):
+    """
+    Like `executor.map`, but only `max_pending` items are in flight at once.
+
+    `executor.map` submits every item up front. Here a new item is only
+    pulled from `items` once the oldest result has been yielded, so a slow
+    consumer applies backpressure all the way to the input. Results are
+    yielded in input order regardless of which worker finishes first.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class BackgroundStage:
+    """
+    Runs submitted calls one at a time, in order, on a dedicated thread.
+
+    The queue between the caller and the thread holds at most `queue_size`
+    calls, so `submit` blocks while the stage is behind. An exception
+    raised by a call is re-raised in the caller by the next `submit` or by
+    `close`.
+    """
+
+    _STOP = object()
+
+    def __init__(self, name, queue_size=4):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        self._raise_error()
+        self._queue.put((fn, args))
+
+    def close(self):
+        """Waits for every submitted call to finish."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._raise_error()
+
+    def _run(self):
+        while (item := self._queue.get()) is not self._STOP:
+            if self._error is not None:
+                continue  # Drain so a blocked submit can return and see the error
+            fn, args = item
+            try:
+                fn(*args)
+            except BaseException as e:
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,135 @@
+import logging
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """
+    A bounded LRU cache with an optional time-to-live.
+
+    Keys are tuples whose first element is the index generation the value
+    was computed against. Entries from an older generation are never hit
+    again after a reindex and age out of the LRU order; they are also
+    dropped when a persisted cache is loaded for a newer generation.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=None):
+        """
+        Args:
+            max_entries (int): Maximum number of entries kept.
+            ttl_seconds (float, optional): How long an entry stays valid.
+                Entries never expire if None.
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries = OrderedDict()  # key -> (value, stored_at, size_bytes)
+        self._memory_bytes = 0
+        # Guards the entries, their total size and the hit counts
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._ttl is not None and time.time() - entry[1] > self._ttl:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size_bytes = _estimate_size(key) + _estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time(), size_bytes)
+            self._memory_bytes += size_bytes
+            self._evict_over_capacity()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_bytes": self._memory_bytes,
+            }
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Pickled outside the lock, so lookups are not blocked on disk I/O
+        with self._lock:
+            entries = list(self._entries.items())
+        with open(path, "wb") as f:
+            pickle.dump(entries, f)
+
+    def load(self, path: Path, generation):
+        """Loads a persisted cache, keeping only entries for `generation`."""
+        path = Path(path)
+        if not path.exists():
+            return
+        try:
+            with open(path, "rb") as f:
+                entries = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Ignoring unreadable query cache at {path}: {e}")
+            return
+
+        with self._lock:
+            for key, (value, stored_at, size_bytes) in entries:
+                if key[0] != generation:
+                    continue
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (value, stored_at, size_bytes)
+                self._memory_bytes += size_bytes
+            self._evict_over_capacity()
+
+    def _evict_over_capacity(self):
+        """Drops least recently used entries over `max_entries`. Call with the lock held."""
+        while len(self._entries) > self._max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Call with the lock held."""
+        _, _, size_bytes = self._entries.pop(key)
+        self._memory_bytes -= size_bytes
+
+
+def _estimate_size(obj):
+    """Approximate memory held by a cached key or value, in bytes."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            _estimate_size(k) + _estimate_size(v) for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(_estimate_size(item) for item in obj)
+    return sys.getsizeof(obj)
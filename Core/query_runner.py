@@ -1,58 +1,139 @@
+import json
+import logging
+import os
 from pathlib import Path
 import numpy as np
 from factories.embedding_model_factory import EmbeddingModelFactory
-from TestRunner.config import PROCESSED_DATA_PATH
-from annoy import AnnoyIndex
+from factories.vector_backend_factory import DEFAULT_VECTOR_BACKEND, VectorBackendFactory
+from config import CORPORA_PATH, PROCESSED_DATA_PATH
+from Core.config import EMBEDDING_DIM
 from Core.tokenizer import Tokenizer
-import pickle
+from Core.inverted_index import InvertedIndex
+from Core.query_cache import QueryCache
+from Core.generations import current_dir
+
+logger = logging.getLogger(__name__)
 
 
 class QueryRunner:
 
-    def __init__(self, processed_data_id, config):
+    def __init__(self, processed_data_id, config, corpus_name=None, embedding_model=None):
+        """
+        Args:
+            processed_data_id (str): A test build to query, or None.
+            config (dict): Query settings.
+            corpus_name (str, optional): A named corpus under
+                `ProcessedData/Corpora` to query instead of the production
+                index.
+            embedding_model (SentenceTransformer, optional): An already
+                loaded query encoder, so runners of several corpora can
+                share one model. Loaded from the config if not given.
+        """
         (
-            self._annoy_index,
-            self._keyword_index
-         ) = self._load_resources(processed_data_id)
+            self._vector_index,
+            self._keyword_index,
+            self.generation,
+         ) = self._load_resources(processed_data_id, corpus_name)
         self._tokenizer = Tokenizer()
+        self._tokenizer.load_lemma_table(self.resources_dir / "lemma_table.json")
+        self._top_k = config.get("top_k", 5)
+        self._keyword_retrieval = config.get("keyword_retrieval", "maxscore")
+        # Query-time knobs of the vector backend, e.g. IVF's nprobe or Annoy's search_k
+        self._vector_index.configure_search(**config.get("vector_search", {}))
+        self._query_workers = config.get("query_workers", os.cpu_count())
+        self.last_postings_evaluated = 0
+
+        # Query text -> embedding, for queries seen against this generation
+        cache_config = config.get("query_cache", {})
+        self.embedding_cache = (
+            QueryCache(cache_config.get("max_entries", 1024), cache_config.get("ttl_seconds"))
+            if cache_config.get("enabled", False) else None
+        )
 
-        embedding_model_name = config["embedding_model"]
-        emf = EmbeddingModelFactory()
-        self._embedding_model = emf.get_model(embedding_model_name)
+        if embedding_model is None:
+            emf = EmbeddingModelFactory()
+            embedding_model = emf.get_model(config["embedding_model"])
+        self._embedding_model = embedding_model
 
     def query(self, query):
-        annoy_results = self._query_annoy(query)
+        vector_results = self._query_vectors(query)
         keyword_results = self._query_keyword(query)
+        return self._format_scores(vector_results, keyword_results)
+
+    def query_many(self, queries):
+        """
+        Runs many queries at once.
 
-        normalized_annoy = self._normalize_scores([1 - d for d in annoy_results[1]])  # Convert distances to similarities
-        normalized_bm25 = self._normalize_scores(keyword_results[1])
+        All queries are encoded in a single batched forward pass, the vector
+        backend searches for the whole batch at once (concurrent lookups for
+        Annoy, one blocked matrix product for NumPy), and BM25 scores for
+        the whole batch are computed as one sparse matrix product.
 
-        final_annoy_scores = (annoy_results[0], normalized_annoy)
-        final_keyword_scores = (keyword_results[0], normalized_bm25)
-        return final_annoy_scores, final_keyword_scores
+        Args:
+            queries (list[str]): The queries to run.
 
-    def _normalize_scores(self, scores):
-        min_score = min(scores)
-        max_score = max(scores)
-        return [(s - min_score) / (max_score - min_score + 1e-9) for s in scores]  # Normalize to 0-1
+        Returns:
+            list[tuple]: One `(annoy_scores, keyword_scores)` pair per query,
+                in the same format as `query`.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
 
-    def _query_annoy(self, query):
-        embedded_query = self._embedding_model.encode(query, convert_to_tensor=True)
-        raw_results = self._annoy_index.get_nns_by_vector(
-                    embedded_query, 5, include_distances=True
-                )
-        return raw_results
+        embedded_queries = self._encode_queries(queries)
+        vector_results = self._vector_index.search_many(
+            embedded_queries, self._top_k, workers=self._query_workers
+        )
+
+        tokenized_queries = self._tokenizer.tokenize_many(queries)
+        keyword_results = self._keyword_index.search_many(tokenized_queries, self._top_k)
+
+        return [
+            self._format_scores(vector_result, keyword_result)
+            for vector_result, keyword_result in zip(vector_results, keyword_results)
+        ]
+
+    def _format_scores(self, vector_results, keyword_results):
+        # Backends already return similarities; normalization and fusion
+        # are left to the Ranker
+        return (vector_results[0], vector_results[1]), (keyword_results[0], keyword_results[1])
+
+    def _encode_queries(self, queries):
+        """Embeds queries in one forward pass, skipping those already cached."""
+        embeddings = [None] * len(queries)
+        misses = []
+        for i, query in enumerate(queries):
+            if self.embedding_cache is not None:
+                embeddings[i] = self.embedding_cache.get((self.generation, query))
+            if embeddings[i] is None:
+                misses.append(i)
+
+        if misses:
+            encoded = self._embedding_model.encode([queries[i] for i in misses])
+            for i, embedding in zip(misses, encoded):
+                embeddings[i] = embedding
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put((self.generation, queries[i]), embedding)
+
+        return embeddings
+
+    def _query_vectors(self, query):
+        embedded_query = self._encode_queries([query])[0]
+        return self._vector_index.search(embedded_query, self._top_k)
 
     def _query_keyword(self, query):
         tokenized_query = self._tokenizer.tokenize(
             query
         )
-        raw_results = self._keyword_index.get_scores(tokenized_query)
+        # Only chunks containing a query term are scored, in the same
+        # (ids, scores) format as the vector search output
+        if self._keyword_retrieval == "exhaustive":
+            return self._keyword_index.search(tokenized_query, self._top_k)
 
-        # format to better match annoy output
-        top_indices = np.argsort(raw_results)[-5:][::-1]  # TODO: Extract top k to config
-        top_values = raw_results[top_indices]
-        return (top_indices.tolist(), top_values.tolist())
+        ids, scores, postings_evaluated = self._keyword_index.top_k(tokenized_query, self._top_k)
+        self.last_postings_evaluated = postings_evaluated
+        logger.debug(f"Keyword query evaluated {postings_evaluated} postings")
+        return (ids, scores)
 
 
     def _query_documents_keyword(self, query):
@@ -60,39 +141,46 @@ class QueryRunner:
         keyword_results = self._keyword_index.get_scores(query_tokens)
         return keyword_results
 
-    def _load_resources(self, processed_data_id):
+    def _load_resources(self, processed_data_id, corpus_name=None):
         """
-        Load annoy and bm25 index
+        Load the vector and bm25 index, and the generation id of the build
         
         In production 
         """
-        resources_dir = (
+        corpus_dir = (
                 (
                 PROCESSED_DATA_PATH / Path("Testing")
                 / Path(
                     processed_data_id
                 )
             ) if processed_data_id is not None else (
+                CORPORA_PATH / corpus_name
+            ) if corpus_name is not None else (
                 PROCESSED_DATA_PATH / Path("Production")
             )
         )
-        annoy_index = self._load_annoy_index(resources_dir)
+        self.corpus_dir = corpus_dir
+        # The build published when the runner is created; later builds
+        # are picked up by creating a new runner
+        self.resources_dir = resources_dir = current_dir(corpus_dir)
+        with open(resources_dir / "metadata.json", "r") as f:
+            metadata = json.load(f)
+        vector_index = self._load_vector_index(resources_dir, metadata)
         keyword_index = self._load_keyword_index(resources_dir)
-        return annoy_index, keyword_index
+        return vector_index, keyword_index, metadata.get("generation")
 
-    def _load_annoy_index(self, resources_dir):
+    def _load_vector_index(self, resources_dir, metadata):
         """
-        Load the Annoy index for similarity search.
+        Load the vector index for similarity search, using the backend it
+        was built with. Builds that predate pluggable backends are Annoy.
         """
-        path = resources_dir / Path("embeddings.ann")
-        embedding_dim = 384 # Extract to config
-        annoy_index = AnnoyIndex(embedding_dim, "angular")
-        annoy_index.load(str(path))
-        return annoy_index
+        backend_config = metadata.get("vector_backend", DEFAULT_VECTOR_BACKEND)
+        vector_index = VectorBackendFactory().load(backend_config, resources_dir, EMBEDDING_DIM)
+        # Settings picked by Benchmarks.ann_tuning; the query config overrides them
+        vector_index.configure_search(**metadata.get("vector_search", {}))
+        return vector_index
 
     def _load_keyword_index(self, resources_dir):
-        path = resources_dir / Path("bm25_index.pkl")
-        with open(path, 'rb') as f:
-            keyword_index = pickle.load(f)
-        return keyword_index
+        path = resources_dir / Path("keyword_index")
+        return InvertedIndex.load(path)
 
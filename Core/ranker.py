@@ -1,7 +1,20 @@
-import pandas as pd
+import numpy as np
 
 
 class Ranker:
+    """
+    Fuses semantic and keyword results into a single ranking.
+
+    Scores from each retriever are min-max normalized to 0-1, then combined
+    with the fusion method selected by `fusion.method` in the config:
+        - "weighted_sum": `w_semantic * semantic + w_keyword * keyword`.
+        - "rrf": weighted reciprocal-rank fusion,
+          `sum(w / (rrf_k + rank))` over the lists a result appears in.
+
+    The ranking is returned as a dict of equal-length lists with the keys
+    "ID", "Semantic_Score", "Keyword_Score" and "Combined_Score", sorted by
+    combined score, best first.
+    """
 
     def __init__(self, config):
         self._config = config
@@ -10,25 +23,67 @@ class Ranker:
         self._semantic_weight = weights[0]
         self._keyword_weight = weights[1]
 
+        fusion_config = self._config.get("fusion", {})
+        self._fusion_method = fusion_config.get("method", "weighted_sum")
+        self._rrf_k = fusion_config.get("rrf_k", 60)
+
+        self._fusion_map = {
+            "weighted_sum": self._weighted_sum,
+            "rrf": self._reciprocal_rank,
+        }
+        if self._fusion_method not in self._fusion_map:
+            raise ValueError(f"Fusion method '{self._fusion_method}' not available.")
+
     def rank(self, annoy_scores, keyword_scores):
+        """
+        Args:
+            annoy_scores (tuple): Result ids and similarities from the vector
+                index, best first.
+            keyword_scores (tuple): Result ids and BM25 scores, best first.
+
+        Returns:
+            dict: The fused ranking.
+        """
         annoy_ids, annoy_similarity = annoy_scores
         keyword_ids, keyword_similarity = keyword_scores
 
-        df_annoy = pd.DataFrame({'ID': annoy_ids, 'Semantic_Score': annoy_similarity})
-        df_keyword = pd.DataFrame({'ID': keyword_ids, 'Keyword_Score': keyword_similarity})
+        # Union of both result lists, in first-seen order
+        ids = list(dict.fromkeys([*annoy_ids, *keyword_ids]))
+        position = {id: i for i, id in enumerate(ids)}
+        annoy_positions = np.array([position[id] for id in annoy_ids], dtype=np.int64)
+        keyword_positions = np.array([position[id] for id in keyword_ids], dtype=np.int64)
 
-        df_ranked = pd.merge(df_annoy, df_keyword, on='ID', how='outer').fillna(0)
+        semantic = np.zeros(len(ids))
+        keyword = np.zeros(len(ids))
+        semantic[annoy_positions] = self.normalize_scores(annoy_similarity)
+        keyword[keyword_positions] = self.normalize_scores(keyword_similarity)
 
-        df_ranked['Combined_Score'] = (
-            self._semantic_weight * df_ranked['Semantic_Score'] +
-            self._keyword_weight * df_ranked['Keyword_Score']
+        combined = self._fusion_map[self._fusion_method](
+            semantic, keyword, annoy_positions, keyword_positions
         )
+        order = np.argsort(-combined, kind="stable")
 
-        # Sort by Combined Score in descending order
-        df_ranked = df_ranked.sort_values(by='Combined_Score', ascending=False)
+        return {
+            "ID": [ids[i] for i in order],
+            "Semantic_Score": semantic[order].tolist(),
+            "Keyword_Score": keyword[order].tolist(),
+            "Combined_Score": combined[order].tolist(),
+        }
 
-        # Reset index
-        df_ranked.reset_index(drop=True, inplace=True)
+    @staticmethod
+    def normalize_scores(scores):
+        """Min-max normalizes scores to 0-1."""
+        scores = np.asarray(scores, dtype=np.float64)
+        if not len(scores):
+            return scores
+        return (scores - scores.min()) / (scores.max() - scores.min() + 1e-9)
 
-        return df_ranked
+    def _weighted_sum(self, semantic, keyword, annoy_positions, keyword_positions):
+        return self._semantic_weight * semantic + self._keyword_weight * keyword
 
+    def _reciprocal_rank(self, semantic, keyword, annoy_positions, keyword_positions):
+        combined = np.zeros(len(semantic))
+        ranks = np.arange(1, max(len(annoy_positions), len(keyword_positions)) + 1)
+        combined[annoy_positions] += self._semantic_weight / (self._rrf_k + ranks[:len(annoy_positions)])
+        combined[keyword_positions] += self._keyword_weight / (self._rrf_k + ranks[:len(keyword_positions)])
+        return combined
@@ -0,0 +1,148 @@
+import json
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+
+class ColumnSpill:
+    """
+    An append-only column of fixed-width numbers kept on disk.
+
+    Values are buffered in memory and appended to a raw binary file once
+    the buffer is full, so memory stays bounded however many values are
+    added. The finished column is converted to a `.npy` file in blocks.
+    """
+
+    _TYPECODES = {np.dtype(np.int32): "i", np.dtype(np.int64): "q", np.dtype(np.uint8): "B"}
+
+    def __init__(self, path: Path, dtype, buffer_size=1 << 16):
+        """
+        Parameters
+        ----------
+        path : Path
+            Raw file the column is spilled to. It is truncated if it exists.
+        dtype : np.dtype
+            One of int32, int64 or uint8.
+        buffer_size : int
+            Number of values buffered before they are written out.
+        """
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self._typecode = self._TYPECODES[self.dtype]
+        self._buffer = array(self._typecode)
+        self._buffer_size = buffer_size
+        self._length = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "wb")
+
+    def __len__(self):
+        return self._length
+
+    def append(self, value):
+        self._buffer.append(value)
+        self._length += 1
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def extend(self, values):
+        self._buffer.extend(values)
+        self._length += len(values)
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        self._buffer.tofile(self._file)
+        self._buffer = array(self._typecode)
+        self._file.flush()
+
+    def blocks(self, block_size=1 << 20):
+        """Yields the column as NumPy arrays of at most `block_size` values."""
+        self.flush()
+        for start in range(0, self._length, block_size):
+            count = min(block_size, self._length - start)
+            yield np.fromfile(self.path, dtype=self.dtype, count=count, offset=start * self.dtype.itemsize)
+
+    def save_npy(self, path: Path, block_size=1 << 20):
+        """Writes the column to a `.npy` file without loading it whole."""
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=(self._length,))
+        start = 0
+        for block in self.blocks(block_size):
+            out[start:start + len(block)] = block
+            start += len(block)
+        out.flush()
+        del out
+
+    def close(self, delete=True):
+        self._file.close()
+        if delete:
+            self.path.unlink(missing_ok=True)
+
+
+class TokenListWriter:
+    """
+    Writes token lists, one per chunk, to disk as they are produced.
+
+    Each list is a line of `<base>.jsonl`; the byte offset of every line is
+    saved to `<base>.offsets.npy` on close so `TokenListReader` can fetch
+    any chunk's tokens without reading the whole file.
+    """
+
+    def __init__(self, base_path: Path):
+        self.base_path = Path(base_path)
+        self.base_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.base_path.with_suffix(".jsonl"), "wb")
+        self._offsets = ColumnSpill(self.base_path.with_suffix(".offsets.bin"), np.int64)
+        self._position = 0
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, tokens):
+        line = json.dumps(tokens).encode("utf-8") + b"\n"
+        self._offsets.append(self._position)
+        self._file.write(line)
+        self._position += len(line)
+
+    def close(self):
+        self._file.close()
+        self._offsets.save_npy(self.base_path.with_suffix(".offsets.npy"))
+        self._offsets.close()
+
+
+class TokenListReader:
+    """
+    Reads token lists written by `TokenListWriter`.
+
+    Iterating streams the lists in chunk id order; `get` seeks to a single
+    chunk. Either way only the requested lists are held in memory, so the
+    reader can be passed anywhere a list of token lists is expected to be
+    iterated, including more than once.
+    """
+
+    def __init__(self, base_path: Path):
+        self.base_path = Path(base_path)
+        self._offsets = np.load(self.base_path.with_suffix(".offsets.npy"), mmap_mode="r")
+        self._file = open(self.base_path.with_suffix(".jsonl"), "rb")
+
+    @classmethod
+    def exists(cls, base_path: Path):
+        base_path = Path(base_path)
+        return base_path.with_suffix(".jsonl").exists() and base_path.with_suffix(".offsets.npy").exists()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        with open(self.base_path.with_suffix(".jsonl"), "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def get(self, chunk_id):
+        self._file.seek(int(self._offsets[chunk_id]))
+        return json.loads(self._file.readline())
+
+    def close(self):
+        self._file.close()
+        # Release the memory map so the files can be replaced
+        self._offsets = None
@@ -1,8 +1,157 @@
 import re
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import itertools
+import logging
+from collections import deque
 
 from .config import RECURSIVE_SPLITTER_CONFIG
 
+logger = logging.getLogger(__name__)
+
+# Components of en_core_web_sm that play no part in sentence segmentation
+_NON_SEGMENTING_PIPES = ["tagger", "attribute_ruler", "lemmatizer", "ner"]
+
+
+def load_sentence_pipeline(mode="parser"):
+    """
+    Loads a spaCy pipeline for sentence segmentation.
+
+    Modes:
+        - "full": the complete en_core_web_sm pipeline.
+        - "parser": en_core_web_sm with only the dependency parser, which
+          sets the sentence boundaries. Boundaries are identical to "full".
+        - "senter": en_core_web_sm's lightweight statistical sentence
+          segmenter instead of the parser.
+        - "rule": spaCy's punctuation-based sentencizer. No model needed.
+    """
+    import spacy
+
+    if mode == "full":
+        return spacy.load("en_core_web_sm")
+    if mode == "parser":
+        return spacy.load("en_core_web_sm", exclude=_NON_SEGMENTING_PIPES)
+    if mode == "senter":
+        nlp = spacy.load("en_core_web_sm", exclude=_NON_SEGMENTING_PIPES + ["parser"])
+        nlp.enable_pipe("senter")
+        return nlp
+    if mode == "rule":
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        return nlp
+    raise ValueError(f"Sentence segmentation mode '{mode}' not available.")
+
+
+class RecursiveSplitter:
+    """
+    Recursive character splitter that tracks character offsets as it splits.
+
+    Produces the same chunks as langchain's RecursiveCharacterTextSplitter
+    (which keeps separators at the start of the following piece and strips
+    whitespace from chunks), but works on (start, end) spans of the original
+    text instead of copies of it. Chunk ranges are therefore exact, even when
+    the same text occurs more than once, and no searching is needed to
+    recover them.
+    """
+
+    def __init__(self, separators, chunk_size, chunk_overlap, length_function=len):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size})."
+            )
+        self._separators = separators
+        self._patterns = [re.compile(re.escape(sep)) if sep else None for sep in separators]
+        self._chunk_size = chunk_size
+        self._chunk_overlap = chunk_overlap
+        self._length_function = length_function
+
+    def split_spans(self, text, start=0, end=None):
+        """
+        Splits `text[start:end]` and returns the (start, end) span of each
+        chunk within `text`.
+        """
+        end = len(text) if end is None else end
+        return self._split(text, start, end, 0)
+
+    def _length(self, text, start, end):
+        if self._length_function is len:
+            return end - start
+        return self._length_function(text[start:end])
+
+    def _split(self, text, start, end, level):
+        # Use the first separator that occurs in the span. Finer separators
+        # are only tried on pieces that are still too long.
+        separator_index = len(self._separators) - 1
+        next_level = None
+        for i in range(level, len(self._separators)):
+            pattern = self._patterns[i]
+            if pattern is None:
+                separator_index = i
+                break
+            if pattern.search(text, start, end):
+                separator_index = i
+                next_level = i + 1 if i + 1 < len(self._separators) else None
+                break
+
+        pattern = self._patterns[separator_index]
+        if pattern is None:
+            cuts = range(start + 1, end)  # Every character is its own piece
+        else:
+            cuts = [match.start() for match in pattern.finditer(text, start, end)]
+        bounds = [start, *cuts, end]
+        pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+        chunks = []
+        good_pieces = []
+        for piece in pieces:
+            if self._length(text, *piece) < self._chunk_size:
+                good_pieces.append(piece)
+                continue
+
+            if good_pieces:
+                chunks.extend(self._merge(text, good_pieces))
+                good_pieces = []
+            if next_level is None:
+                chunks.append(piece)
+            else:
+                chunks.extend(self._split(text, *piece, next_level))
+
+        if good_pieces:
+            chunks.extend(self._merge(text, good_pieces))
+        return chunks
+
+    def _merge(self, text, pieces):
+        """Merges adjacent pieces into chunks of up to chunk_size, with overlap."""
+        chunks = []
+        current = deque()
+        total = 0
+        for piece in pieces:
+            length = self._length(text, *piece)
+            if total + length > self._chunk_size:
+                if total > self._chunk_size:
+                    logger.warning(
+                        f"Created a chunk of size {total}, which is longer than the specified {self._chunk_size}"
+                    )
+                if current:
+                    self._append_stripped(text, current[0][0], current[-1][1], chunks)
+                    while total > self._chunk_overlap or (
+                        total + length > self._chunk_size and total > 0
+                    ):
+                        total -= self._length(text, *current.popleft())
+            current.append(piece)
+            total += length
+
+        if current:
+            self._append_stripped(text, current[0][0], current[-1][1], chunks)
+        return chunks
+
+    @staticmethod
+    def _append_stripped(text, start, end, chunks):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            chunks.append((start, end))
+
 
 class TextSplitter:
     def __init__(self, methods: list, nlp):
@@ -17,12 +166,12 @@ class TextSplitter:
     def _create_recursive_splitters(self):
         return {
             "large": [
-                RecursiveCharacterTextSplitter(
+                RecursiveSplitter(
                 **RECURSIVE_SPLITTER_CONFIG["large_w_overlap"]
                 ),
             ],
             "small": [
-                RecursiveCharacterTextSplitter(
+                RecursiveSplitter(
                     **RECURSIVE_SPLITTER_CONFIG["small_w_overlap"]
                 ),
             ]
@@ -83,6 +232,39 @@ class TextSplitter:
 
         return splits
 
+    def split_many(self, documents, batch_size=64, n_process=1):
+        """
+        Splits a stream of documents, yielding one list of splits per document.
+
+        Produces the same splits as calling `split` on each document, but
+        sentence segmentation streams the documents through `nlp.pipe` in
+        batches of `batch_size`, optionally across `n_process` worker
+        processes.
+        """
+        if "by_sentence" not in self._methods:
+            for document in documents:
+                yield self.split(document)
+            return
+
+        documents, pipe_input = itertools.tee(documents)
+        sentence_docs = self._nlp.pipe(pipe_input, batch_size=batch_size, n_process=n_process)
+
+        for document, sentence_doc in zip(documents, sentence_docs):
+            splits = []
+            for method in self._methods:
+                if method not in self._method_map:
+                    raise ValueError(f"Split method '{method}' not available.")
+
+                if method == "by_sentence":
+                    raw_splits = self._sentence_splits(sentence_doc)
+                else:
+                    raw_splits = self._method_map[method](document)
+                for split in raw_splits:
+                    split["method"] = method
+
+                splits.extend(raw_splits)
+            yield splits
+
     def _recursive_split(self, document):
         """
         Implements multi-granularity chunking:
@@ -94,34 +276,23 @@ class TextSplitter:
         all_splits = []
 
         for splitter in self._recursive_splitters["large"]:
-            large_chunks = splitter.split_text(document)
-
-            large_ranges = [
-                [document.find(chunk), document.find(chunk) + len(chunk)]
-                for chunk in large_chunks
-            ]
-
-            for large_chunk, large_range in zip(large_chunks, large_ranges):
+            for large_start, large_end in splitter.split_spans(document):
                 large_chunk_entry = {
-                    "text": large_chunk,
-                    "range": large_range,
+                    "text": document[large_start:large_end],
+                    "range": [large_start, large_end],
                     "granularity": "large"
                 }
                 all_splits.append(large_chunk_entry)
 
-                large_start = large_range[0]  # Offset for small chunk ranges
+                # Small chunks are split from the large chunk's span of the
+                # document, so their ranges are already absolute
                 for small_splitter in self._recursive_splitters["small"]:
-                    small_chunks = small_splitter.split_text(large_chunk)
-
-                    small_ranges = [
-                        [large_start + large_chunk.find(chunk), large_start + large_chunk.find(chunk) + len(chunk)]
-                        for chunk in small_chunks
-                    ]
-
-                    for small_chunk, small_range in zip(small_chunks, small_ranges):
+                    for small_start, small_end in small_splitter.split_spans(
+                        document, large_start, large_end
+                    ):
                         all_splits.append({
-                            "text": small_chunk,
-                            "range": small_range,
+                            "text": document[small_start:small_end],
+                            "range": [small_start, small_end],
                             "granularity": "small",
                             "parent_large_chunk": large_chunk_entry
                         })
@@ -159,12 +330,10 @@ class TextSplitter:
         - Split on ., ?, !
         - Split on new lines
         """
-        doc = self._nlp(document)
-        splits = []
-        ranges = []
-
-        for sent in doc.sents:
-            splits.append(sent.text)
-            ranges.append([sent.start_char, sent.end_char])
+        return self._sentence_splits(self._nlp(document))
 
-        return [{"text": split, "range": r} for split, r in zip(splits, ranges)]
+    def _sentence_splits(self, doc):
+        return [
+            {"text": sent.text, "range": [sent.start_char, sent.end_char]}
+            for sent in doc.sents
+        ]
@@ -1,13 +1,66 @@
+import json
+import logging
 import unicodedata
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer, WordNetLemmatizer
 
-nltk.download("stopwords", quiet=True)
-nltk.download("wordnet", quiet=True)
+logger = logging.getLogger(__name__)
+
+# NLTK data used by the tokenizer, by package name
+NLTK_RESOURCES = {"stopwords": "corpora/stopwords", "wordnet": "corpora/wordnet"}
+
+
+def ensure_nltk_resource(resource_path, package):
+    """
+    Makes sure an NLTK resource is installed in one of the local NLTK data
+    directories. Nothing is downloaded here, so queries never wait on the
+    network; resources are fetched by `download_nltk_resources` during setup.
+
+    Raises
+    ------
+    LookupError
+        If the resource is not installed.
+    """
+    import nltk
+
+    try:
+        nltk.data.find(resource_path)
+    except LookupError:
+        raise LookupError(
+            f"NLTK resource '{package}' is not installed. Install it with "
+            f"`python -m nltk.downloader {package}`, or run preprocessing, which downloads it."
+        ) from None
+
+
+def download_nltk_resources():
+    """Downloads the NLTK resources the tokenizer needs that are not installed yet."""
+    import nltk
+
+    for package, resource_path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource_path)
+        except LookupError:
+            logger.info(f"Downloading NLTK resource {package}")
+            if not nltk.download(package, quiet=True):
+                raise RuntimeError(f"Could not download NLTK resource '{package}'.")
+
+
+WORD_PATTERN = re.compile(r"\b\w+\b")
+DEFAULT_CACHE_SIZE = 1_000_000
+
 
 class Tokenizer:
+    """
+    Turns text into BM25 tokens.
+
+    Every distinct word is only filtered, stemmed and lemmatized once: the
+    result is kept in a vocabulary-level cache mapping the lowercased
+    surface form to its final token (None for stopwords). The cache is
+    bounded to `cache_size` words, evicting the oldest first, and can be
+    saved with the index and loaded at query time so query tokenization is
+    mostly dictionary lookups.
+
+    NLTK is only imported the first time a word misses the cache.
+    """
     _shared_state = {}  # Shared state for all instances
 
     def __new__(cls, *args, **kwargs):
@@ -15,18 +68,27 @@ class Tokenizer:
         obj.__dict__ = cls._shared_state  # Share state across instances
         return obj
 
-    def __init__(self, remove_stopwords=True, use_stemming=False, use_lemmatization=True):
+    def __init__(self, remove_stopwords=True, use_stemming=False, use_lemmatization=True,
+                 cache_size=DEFAULT_CACHE_SIZE):
         if not hasattr(self, "initialized"):  # Ensure it only runs once
             self.remove_stopwords = remove_stopwords
             self.use_stemming = use_stemming
             self.use_lemmatization = use_lemmatization
-            self.stopwords = set(stopwords.words("english")) if remove_stopwords else set()
-            self.stemmer = PorterStemmer() if use_stemming else None
-            self.lemmatizer = WordNetLemmatizer() if use_lemmatization else None
+            self.stopwords = None
+            self.stemmer = None
+            self.lemmatizer = None
+            self.cache_size = cache_size
+            self._cache = {}  # surface form -> final token, or None if dropped
+            # Set by worker processes whose cache entries are merged into the parent's
+            self.track_new_entries = False
+            self._new_entries = {}  # Entries added since the last `take_new_entries`
             self.initialized = True  # Mark initialization as done
 
     def normalize(self, text):
         """Removes accents and converts to lowercase."""
+        if text.isascii():
+            # NFKD leaves ASCII unchanged and yields no combining marks
+            return text.lower()
         text = "".join(
             c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
         )
@@ -34,16 +96,91 @@ class Tokenizer:
 
     def tokenize(self, text):
         """Tokenizes text with the current settings."""
-        text = self.normalize(text)
-        tokens = re.findall(r"\b\w+\b", text)
+        cache = self._cache
+        tokens = []
+        for word in WORD_PATTERN.findall(self.normalize(text)):
+            token = cache[word] if word in cache else self._add_to_cache(word)
+            if token is not None:
+                tokens.append(token)
+        return tokens
+
+    def tokenize_many(self, texts):
+        """Tokenizes each text, returning one token list per text."""
+        return [self.tokenize(text) for text in texts]
+
+    def _load_nltk(self):
+        """Loads the stopword list, stemmer and lemmatizer on first use."""
+        from nltk.stem import PorterStemmer, WordNetLemmatizer
 
         if self.remove_stopwords:
-            tokens = [word for word in tokens if word not in self.stopwords]
+            ensure_nltk_resource(NLTK_RESOURCES["stopwords"], "stopwords")
+            from nltk.corpus import stopwords
+            self.stopwords = set(stopwords.words("english"))
+        else:
+            self.stopwords = set()
+        if self.use_lemmatization:
+            ensure_nltk_resource(NLTK_RESOURCES["wordnet"], "wordnet")
+        self.stemmer = PorterStemmer() if self.use_stemming else None
+        self.lemmatizer = WordNetLemmatizer() if self.use_lemmatization else None
 
+    def _process_word(self, word):
+        if self.stopwords is None:
+            self._load_nltk()
+        if self.remove_stopwords and word in self.stopwords:
+            return None
         if self.use_stemming:
-            tokens = [self.stemmer.stem(word) for word in tokens]
-
+            word = self.stemmer.stem(word)
         if self.use_lemmatization:
-            tokens = [self.lemmatizer.lemmatize(word) for word in tokens]
+            word = self.lemmatizer.lemmatize(word)
+        return word
 
-        return tokens
+    def _add_to_cache(self, word):
+        token = self._process_word(word)
+        if len(self._cache) >= self.cache_size:
+            del self._cache[next(iter(self._cache))]
+        self._cache[word] = token
+        if self.track_new_entries:
+            self._new_entries[word] = token
+        return token
+
+    def _settings(self):
+        return {
+            "remove_stopwords": self.remove_stopwords,
+            "use_stemming": self.use_stemming,
+            "use_lemmatization": self.use_lemmatization,
+        }
+
+    def take_new_entries(self):
+        """Returns the cache entries added since the last call, e.g. in a worker process."""
+        entries, self._new_entries = self._new_entries, {}
+        return entries
+
+    def update_cache(self, entries):
+        """Adds entries computed elsewhere, e.g. by `take_new_entries` in a worker process."""
+        for word, token in entries.items():
+            if word not in self._cache:
+                if len(self._cache) >= self.cache_size:
+                    del self._cache[next(iter(self._cache))]
+                self._cache[word] = token
+
+    def save_lemma_table(self, path):
+        """Saves the surface form -> token cache, along with the settings that produced it."""
+        with open(path, "w") as f:
+            json.dump({"settings": self._settings(), "tokens": self._cache}, f)
+
+    def load_lemma_table(self, path):
+        """
+        Loads a table saved by `save_lemma_table` into the cache.
+
+        The table is ignored if it is missing or was built with different
+        settings.
+        """
+        try:
+            with open(path, "r") as f:
+                table = json.load(f)
+        except FileNotFoundError:
+            return
+        if table["settings"] != self._settings():
+            logger.warning(f"Ignoring lemma table {path}: built with different tokenizer settings.")
+            return
+        self.update_cache(table["tokens"])
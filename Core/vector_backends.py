@@ -0,0 +1,546 @@
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from annoy import AnnoyIndex
+
+
+class VectorBackend(ABC):
+    """
+    Interface of the nearest-neighbour indexes used for semantic search.
+
+    A backend is filled with `add`, finalized with `build` and written with
+    `save`; a saved backend is reopened with the `load` classmethod. Item ids
+    are chunk ids, dense from 0. Searches return `(ids, similarities)`,
+    best first, where a higher similarity is a closer match.
+
+    Options named in `SEARCH_OPTIONS` only affect queries, so they can be
+    changed on a loaded index with `configure_search`.
+
+    Backends must implement the abstract methods; an incomplete backend
+    fails when it is instantiated.
+    """
+
+    name = None
+    SEARCH_OPTIONS = ()
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    @classmethod
+    @abstractmethod
+    def exists(cls, directory: Path):
+        """Whether a saved index of this backend is present in `directory`."""
+
+    @classmethod
+    @abstractmethod
+    def load(cls, directory: Path, dim, **options):
+        """Opens an index saved in `directory`."""
+
+    @abstractmethod
+    def __len__(self):
+        """Number of items added."""
+
+    @abstractmethod
+    def add(self, id, vector):
+        """Adds one item. Items are added in id order."""
+
+    def add_many(self, ids, vectors):
+        for id, vector in zip(ids, vectors):
+            self.add(id, vector)
+
+    def use_build_dir(self, directory: Path):
+        """
+        Lets the backend keep its items in files under `directory` while
+        the index is built, rather than in memory. Must be called before
+        the first `add`; backends that always build in memory ignore it.
+        """
+
+    def build(self):
+        """Finalizes the index once every item has been added."""
+
+    @abstractmethod
+    def save(self, directory: Path):
+        """Writes the built index to `directory`."""
+
+    def unload(self):
+        """Releases any memory-mapped files, e.g. before they are overwritten."""
+
+    @abstractmethod
+    def get_vector(self, id):
+        """The vector of an item, as it was added."""
+
+    @abstractmethod
+    def search(self, vector, k):
+        """The `k` nearest items to `vector`, as `(ids, similarities)`."""
+
+    def search_many(self, vectors, k, workers=None):
+        """Runs `search` for each vector, returning one `(ids, similarities)` per vector."""
+        return [self.search(vector, k) for vector in vectors]
+
+    def configure_search(self, **options):
+        """Applies query-time options; options other backends use are ignored."""
+        for name in self.SEARCH_OPTIONS:
+            if name in options:
+                setattr(self, name, options[name])
+
+
+class AnnoyBackend(VectorBackend):
+    """
+    Approximate search with a forest of random projection trees (Annoy).
+
+    Similarities are `1 - d` for the angular distance `d` Annoy reports.
+    More trees (`n_trees`, fixed at build time) and more nodes inspected
+    per query (`search_k`, default `k * n_trees`) both raise recall at the
+    cost of latency.
+
+    Trees are built on `n_jobs` threads (-1 for every core). With
+    `on_disk_build` and a build directory set, items and trees are written
+    to a memory-mapped file instead of the heap, so memory use does not
+    grow with the index; `save` then moves the file into place.
+    """
+
+    name = "annoy"
+    FILE_NAME = "embeddings.ann"
+    SEARCH_OPTIONS = ("search_k",)
+
+    def __init__(self, dim, n_trees=10, metric="angular", search_k=-1, on_disk_build=False, n_jobs=-1):
+        super().__init__(dim)
+        self.n_trees = n_trees
+        self.metric = metric
+        self.search_k = search_k
+        self.on_disk_build = on_disk_build
+        self.n_jobs = n_jobs
+        self._index = AnnoyIndex(dim, metric)
+        self._build_path = None
+
+    @classmethod
+    def exists(cls, directory: Path):
+        return (Path(directory) / cls.FILE_NAME).exists()
+
+    @classmethod
+    def load(cls, directory: Path, dim, **options):
+        backend = cls(dim, **options)
+        backend._index.load(str(Path(directory) / cls.FILE_NAME))
+        return backend
+
+    def __len__(self):
+        return self._index.get_n_items()
+
+    def use_build_dir(self, directory: Path):
+        if not self.on_disk_build:
+            return
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self._build_path = Path(directory) / self.FILE_NAME
+        self._index.on_disk_build(str(self._build_path))
+
+    def add(self, id, vector):
+        self._index.add_item(id, vector)
+
+    def build(self):
+        self._index.build(n_trees=self.n_trees, n_jobs=self.n_jobs)
+
+    def save(self, directory: Path):
+        path = Path(directory) / self.FILE_NAME
+        if self._build_path is None:
+            self._index.save(str(path))
+            return
+        # The built index already is the file; reopen it from its new place
+        self._index.unload()
+        os.replace(self._build_path, path)
+        self._build_path = None
+        self._index.load(str(path))
+
+    def unload(self):
+        self._index.unload()
+
+    def get_vector(self, id):
+        return self._index.get_item_vector(id)
+
+    def search(self, vector, k):
+        ids, distances = self._index.get_nns_by_vector(
+            vector, k, search_k=self.search_k, include_distances=True
+        )
+        return ids, [1 - d for d in distances]  # Convert distances to similarities
+
+    def search_many(self, vectors, k, workers=None):
+        # Annoy releases the GIL while searching, so lookups run concurrently
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda vector: self.search(vector, k), vectors))
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Exact cosine similarity search over every vector.
+
+    Vectors are L2-normalized and stored as one float32 matrix, saved as
+    `.npy` and memory-mapped when loaded. Queries are scored against blocks
+    of rows with a matrix product, keeping the running top `k` per query
+    with `argpartition`, so a batch of queries reads the matrix once.
+
+    With `quantization` set to "float16" or "int8", a compact copy of the
+    matrix is saved next to the full-precision one. Searches scan the
+    compact copy for `k * rescore_factor` candidates and re-score only
+    those rows against the float32 matrix, which stays on disk and is only
+    paged in for the candidates. int8 codes use a per-dimension scale and
+    offset fitted to the data.
+    """
+
+    name = "numpy"
+    FILE_NAME = "embeddings.npy"
+    SEARCH_OPTIONS = ("rescore_factor",)
+    QUANTIZATIONS = {"float16": np.float16, "int8": np.int8}
+
+    def __init__(self, dim, max_block_cells=1 << 24, quantization=None, rescore_factor=4):
+        """
+        Parameters
+        ----------
+        dim : int
+            Dimensionality of the vectors.
+        max_block_cells : int
+            Maximum size of the (queries x rows) score matrix computed at
+            once.
+        quantization : str, optional
+            "float16" or "int8" to search a compact copy of the vectors.
+        rescore_factor : int
+            Candidates re-scored at full precision per requested result.
+        """
+        super().__init__(dim)
+        if quantization is not None and quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.max_block_cells = max_block_cells
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._pending = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._codes = None
+        self._scale = None
+        self._offset = None
+
+    @classmethod
+    def exists(cls, directory: Path):
+        return (Path(directory) / cls.FILE_NAME).exists()
+
+    @classmethod
+    def load(cls, directory: Path, dim, **options):
+        directory = Path(directory)
+        backend = cls(dim, **options)
+        backend._vectors = np.load(directory / cls.FILE_NAME, mmap_mode="r")
+        if backend.quantization is not None:
+            backend._codes = np.load(directory / backend._codes_file_name(), mmap_mode="r")
+        if backend.quantization == "int8":
+            params = np.load(directory / "embeddings.int8_params.npy")
+            backend._scale, backend._offset = params[0], params[1]
+        return backend
+
+    def __len__(self):
+        return len(self._vectors) + len(self._pending)
+
+    @property
+    def memory_bytes(self):
+        """Bytes of vector data scanned by every search."""
+        return (self._codes if self._codes is not None else self._vectors).nbytes
+
+    def add(self, id, vector):
+        self._pending[id] = vector
+
+    def build(self):
+        n_items = max(self._pending, default=-1) + 1
+        vectors = np.zeros((n_items, self.dim), dtype=np.float32)
+        for id, vector in self._pending.items():
+            vectors[id] = vector
+        self._pending = {}
+        self._vectors = self._normalize(vectors)
+        if self.quantization is not None:
+            self._codes = self._quantize(self._vectors)
+
+    def _quantize(self, vectors):
+        if self.quantization == "float16":
+            return vectors.astype(np.float16)
+
+        # Maps each dimension's [min, max] onto the 256 int8 codes:
+        # value ~= offset + scale * code
+        low = vectors.min(axis=0) if len(vectors) else np.zeros(self.dim, np.float32)
+        high = vectors.max(axis=0) if len(vectors) else np.zeros(self.dim, np.float32)
+        self._scale = np.maximum((high - low) / 255, 1e-12).astype(np.float32)
+        self._offset = (low + 128 * self._scale).astype(np.float32)
+        codes = np.rint((vectors - self._offset) / self._scale)
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def _codes_file_name(self):
+        return f"embeddings.{self.quantization}.npy"
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        np.save(directory / self.FILE_NAME, self._vectors)
+        if self.quantization is not None:
+            np.save(directory / self._codes_file_name(), self._codes)
+        if self.quantization == "int8":
+            np.save(directory / "embeddings.int8_params.npy", np.stack([self._scale, self._offset]))
+
+    def unload(self):
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._codes = None
+
+    def get_vector(self, id):
+        return np.array(self._vectors[id])
+
+    def search(self, vector, k):
+        return self.search_many([vector], k)[0]
+
+    def search_many(self, vectors, k, workers=None):
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        k = min(k, len(self._vectors))
+        if self.quantization is None:
+            ids, scores = self._top_k(queries, self._vectors, k, self._dot)
+            return self._results(ids, scores)
+
+        n_candidates = min(k * self.rescore_factor, len(self._vectors))
+        score_block = self._dot if self.quantization == "float16" else self._int8_dot
+        candidates, _ = self._top_k(queries, self._codes, n_candidates, score_block)
+
+        # Re-score the candidates against the full-precision vectors
+        rows, positions = np.unique(candidates, return_inverse=True)
+        full = np.asarray(self._vectors[rows])[positions.reshape(candidates.shape)]
+        scores = np.einsum("qd,qcd->qc", queries, full)
+        ids, scores = self._select(candidates, scores, k)
+        return self._results(ids, scores)
+
+    def _top_k(self, queries, matrix, k, score_block):
+        """Returns the ids and scores of each query's top `k` rows of `matrix`, unsorted."""
+        n_queries, n_items = len(queries), len(matrix)
+        best_ids = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+
+        block_rows = max(k, self.max_block_cells // max(n_queries, 1))
+        for start in range(0, n_items, block_rows):
+            block = np.asarray(matrix[start:start + block_rows])
+            scores = np.concatenate([best_scores, score_block(queries, block)], axis=1)
+            ids = np.concatenate(
+                [best_ids, np.broadcast_to(np.arange(start, start + len(block)), (n_queries, len(block)))],
+                axis=1,
+            )
+            best_ids, best_scores = self._select(ids, scores, k)
+        return best_ids, best_scores
+
+    @staticmethod
+    def _select(ids, scores, k):
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            ids = np.take_along_axis(ids, top, axis=1)
+        return ids, scores
+
+    @staticmethod
+    def _dot(queries, block):
+        return queries @ block.astype(np.float32, copy=False).T
+
+    def _int8_dot(self, queries, codes):
+        # q . (offset + scale * code) = q . offset + (q * scale) . code
+        return (queries * self._scale) @ codes.astype(np.float32).T + (queries @ self._offset)[:, None]
+
+    @staticmethod
+    def _results(ids, scores):
+        order = np.argsort(-scores, axis=1, kind="stable")
+        scores = np.take_along_axis(scores, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        return [(row_ids.tolist(), row_scores.tolist()) for row_ids, row_scores in zip(ids, scores)]
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class IVFBackend(VectorBackend):
+    """
+    Inverted-file index: exact search within the clusters nearest a query.
+
+    A spherical k-means coarse quantizer with `n_lists` centroids is
+    trained on a sample of at most `train_size` vectors (and at least 40
+    per list). Every vector is assigned to its nearest centroid, and the
+    vectors of each list are stored contiguously, so a query scores its
+    `nprobe` nearest lists as a few dense matrix products. Queries in a
+    batch that probe the same list share one pass over it.
+
+    Saved as `ivf_centroids.npy`, `ivf_vectors.npy` (normalized float32,
+    grouped by list), `ivf_ids.npy` (the chunk id of each row) and
+    `ivf_offsets.npy` (where each list starts), memory-mapped on load.
+    """
+
+    name = "ivf"
+    FILE_NAMES = ("ivf_centroids", "ivf_vectors", "ivf_ids", "ivf_offsets")
+    SEARCH_OPTIONS = ("nprobe",)
+
+    def __init__(self, dim, n_lists=None, nprobe=8, train_size=100_000, n_iter=10, seed=0):
+        """
+        Parameters
+        ----------
+        dim : int
+            Dimensionality of the vectors.
+        n_lists : int, optional
+            Number of clusters. Defaults to sqrt(number of vectors).
+        nprobe : int
+            Lists searched per query; more lists trade latency for recall.
+        train_size : int
+            Number of vectors k-means is trained on.
+        n_iter : int
+            k-means iterations.
+        seed : int
+            Seed for sampling and centroid initialization.
+        """
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.n_iter = n_iter
+        self.seed = seed
+        self._pending = {}
+        self._centroids = np.empty((0, dim), dtype=np.float32)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._positions = None
+
+    @classmethod
+    def exists(cls, directory: Path):
+        return all((Path(directory) / f"{name}.npy").exists() for name in cls.FILE_NAMES)
+
+    @classmethod
+    def load(cls, directory: Path, dim, **options):
+        directory = Path(directory)
+        backend = cls(dim, **options)
+        backend._centroids, backend._vectors, backend._ids, backend._offsets = (
+            np.load(directory / f"{name}.npy", mmap_mode="r") for name in cls.FILE_NAMES
+        )
+        backend._centroids = np.asarray(backend._centroids)  # Read by every query
+        backend._offsets = np.asarray(backend._offsets)
+        return backend
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending)
+
+    @property
+    def memory_bytes(self):
+        return self._centroids.nbytes + self._vectors.nbytes + self._ids.nbytes + self._offsets.nbytes
+
+    def add(self, id, vector):
+        self._pending[id] = vector
+
+    def build(self):
+        ids = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+        vectors = NumpyBackend._normalize(
+            np.asarray(list(self._pending.values()), dtype=np.float32).reshape(-1, self.dim)
+        )
+        self._pending = {}
+        self._positions = None
+        if len(vectors) == 0:
+            # An empty corpus: no lists, and every search returns nothing
+            self._centroids = np.empty((0, self.dim), dtype=np.float32)
+            self._vectors, self._ids = vectors, ids
+            self._offsets = np.zeros(1, dtype=np.int64)
+            return
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        self._centroids = self._train(vectors, n_lists)
+        assignments = self._nearest(vectors, self._centroids, 1)[:, 0]
+
+        order = np.argsort(assignments, kind="stable")
+        self._vectors = vectors[order]
+        self._ids = ids[order]
+        self._offsets = np.zeros(len(self._centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(self._centroids)), out=self._offsets[1:])
+
+    def _train(self, vectors, n_lists):
+        """Spherical k-means on a sample of `vectors`."""
+        rng = np.random.default_rng(self.seed)
+        train_size = min(len(vectors), max(self.train_size, 40 * n_lists))
+        sample = vectors[rng.choice(len(vectors), train_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            assignments = self._nearest(sample, centroids, 1)[:, 0]
+            counts = np.bincount(assignments, minlength=n_lists)
+            order = np.argsort(assignments, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            empty = counts == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty])
+            # Restart empty clusters from random sample points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = NumpyBackend._normalize(sums)
+        return centroids
+
+    @staticmethod
+    def _nearest(vectors, centroids, n, block_size=65536):
+        """Indices of the `n` most similar centroids of every vector."""
+        nearest = np.empty((len(vectors), n), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            scores = vectors[start:start + block_size] @ centroids.T
+            if n == 1:
+                nearest[start:start + block_size, 0] = scores.argmax(axis=1)
+            elif n < scores.shape[1]:
+                nearest[start:start + block_size] = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+            else:
+                nearest[start:start + block_size] = np.argsort(-scores, axis=1)
+        return nearest
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        for name, array in zip(self.FILE_NAMES, (self._centroids, self._vectors, self._ids, self._offsets)):
+            np.save(directory / f"{name}.npy", array)
+
+    def unload(self):
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._positions = None
+
+    def get_vector(self, id):
+        if self._positions is None:
+            self._positions = np.empty(int(self._ids.max()) + 1 if len(self._ids) else 0, dtype=np.int64)
+            self._positions[self._ids] = np.arange(len(self._ids))
+        return np.array(self._vectors[self._positions[id]])
+
+    def search(self, vector, k):
+        return self.search_many([vector], k)[0]
+
+    def search_many(self, vectors, k, workers=None):
+        queries = NumpyBackend._normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        if len(self._centroids) == 0:
+            return [([], []) for _ in queries]
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = self._nearest(queries, self._centroids, nprobe)
+
+        candidate_ids = [[] for _ in queries]
+        candidate_scores = [[] for _ in queries]
+        # Visit each probed list once, scoring every query that probes it
+        lists, list_queries = np.unique(probes, return_inverse=True)
+        list_queries = list_queries.reshape(probes.shape)
+        for i, list_id in enumerate(lists):
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            if start == end:
+                continue
+            query_rows = np.flatnonzero((list_queries == i).any(axis=1))
+            scores = queries[query_rows] @ np.asarray(self._vectors[start:end]).T
+            ids = np.asarray(self._ids[start:end])
+            for row, row_scores in zip(query_rows, scores):
+                if len(row_scores) > k:
+                    top = np.argpartition(-row_scores, k - 1)[:k]
+                    candidate_ids[row].append(ids[top])
+                    candidate_scores[row].append(row_scores[top])
+                else:
+                    candidate_ids[row].append(ids)
+                    candidate_scores[row].append(row_scores)
+
+        results = []
+        for ids, scores in zip(candidate_ids, candidate_scores):
+            if not ids:
+                results.append(([], []))
+                continue
+            ids, scores = np.concatenate(ids), np.concatenate(scores)
+            top = np.argsort(-scores, kind="stable")[:k]
+            results.append((ids[top].tolist(), scores[top].tolist()))
+        return results
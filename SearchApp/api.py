@@ -1,24 +1,97 @@
-from fastapi import FastAPI
-from SearchApp.search_orchestrator import SearchOrchestrator
-# from SearchApp.constants import PROCESSED_DATA_DIR
-from path_utils import PROCESSED_DATA_PATH
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from SearchApp.constants import DEFAULT_CORPUS
+from SearchApp.search_service import SearchService
+from SearchApp.query_batcher import QueryBatcher
 import json
-from pathlib import Path
 import importlib.resources
 
-app = FastAPI()
-
-# Load config and id mapping here
-id_mapping_path = PROCESSED_DATA_PATH / "Production" / "id_mapping.json"
-with open(id_mapping_path, "r") as f:
-    id_mapping = json.load(f)
-
 with importlib.resources.files("SearchApp").joinpath("production_config.json").open("r") as f:
     production_config = json.load(f)
 
-orchestrator = SearchOrchestrator(config=production_config, id_mapping=id_mapping)
+# Indexes are loaded and warmed up in the background once the app starts;
+# nothing heavy happens at import time.
+service = SearchService(production_config)
+
+# Concurrent /search requests are encoded and scored together, grouped by corpus
+batching_config = production_config.get("micro_batching", {})
+batcher = QueryBatcher(
+    service.search_many,
+    max_wait_ms=batching_config.get("max_wait_ms", 5),
+    max_batch_size=batching_config.get("max_batch_size", 32),
+) if batching_config.get("enabled", False) else None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    service.start()
+    if batcher is not None:
+        batcher.start()
+    yield
+    if batcher is not None:
+        await batcher.stop()
+    service.stop()
+    service.save_caches()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Larger batches are rejected with a 422, so one request cannot monopolize the encoder
+MAX_BATCH_QUERIES = production_config.get("batch_search", {}).get("max_queries", 256)
+
+
+class BatchSearchRequest(BaseModel):
+    queries: list[str] = Field(max_length=MAX_BATCH_QUERIES)
+    corpus: str = DEFAULT_CORPUS
+
+
+def get_orchestrator(corpus=DEFAULT_CORPUS):
+    try:
+        return service.get_orchestrator(corpus)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    status_code = 200 if service.ready else 503
+    status = service.status()
+    if batcher is not None:
+        status["micro_batching"] = batcher.stats()
+    return JSONResponse(status_code=status_code, content=status)
+
+@app.get("/corpora")
+def corpora():
+    """Corpora that can be queried, and load and memory stats of those loaded."""
+    return {"available": service.registry.available(), **service.registry.stats()}
 
 @app.get("/search")
-def search(query: str):
-    results = orchestrator.search(query)
-    return {"query": query, "results": results[:5]}
+async def search(query: str, corpus: str = DEFAULT_CORPUS):
+    # Loads the corpus if needed, so unknown corpora fail before batching
+    orchestrator = await run_in_threadpool(get_orchestrator, corpus)
+    if batcher is not None:
+        results = await batcher.submit((corpus, query))
+    else:
+        results = await run_in_threadpool(orchestrator.search, query)
+    return {"query": query, "corpus": corpus, "results": results[:5]}
+
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    batch_results = get_orchestrator(request.corpus).search_many(request.queries)
+    return {
+        "corpus": request.corpus,
+        "results": [
+            {"query": query, "results": results[:5]}
+            for query, results in zip(request.queries, batch_results)
+        ]
+    }
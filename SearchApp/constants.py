@@ -3,3 +3,8 @@ from pathlib import Path
 
 DEFAULT_DATA_DIR = Path("TestData/SQuAD")
 PROCESSED_DATA_DIR = Path("ProcessedData/Production")
+
+# Name under which the API serves the production index
+DEFAULT_CORPUS = "default"
+# Named corpora are directories under ProcessedData/Corpora
+CORPUS_NAME_PATTERN = r"[A-Za-z0-9][A-Za-z0-9_.-]*"
@@ -0,0 +1,321 @@
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from config import CORPORA_PATH, PROCESSED_DATA_PATH
+from Core.generations import current_dir, current_generation
+from factories.embedding_model_factory import EmbeddingModelFactory
+from SearchApp.constants import CORPUS_NAME_PATTERN, DEFAULT_CORPUS
+from SearchApp.search_orchestrator import SearchOrchestrator
+
+logger = logging.getLogger(__name__)
+
+
+def corpus_dir(corpus_name):
+    """
+    Returns the processed-data directory of a corpus.
+
+    Raises
+    ------
+    KeyError
+        If the name is not a valid corpus name.
+    """
+    if corpus_name == DEFAULT_CORPUS:
+        return PROCESSED_DATA_PATH / "Production"
+    if not re.fullmatch(CORPUS_NAME_PATTERN, corpus_name):
+        raise KeyError(f"Invalid corpus name: {corpus_name!r}")
+    return CORPORA_PATH / corpus_name
+
+
+def index_bytes(directory):
+    """Size of the files of a processed build, excluding its query caches."""
+    return sum(
+        path.stat().st_size for path in directory.rglob("*")
+        if path.is_file() and "query_cache" not in path.relative_to(directory).parts
+    )
+
+
+class IndexRegistry:
+    """
+    Serves the indexes of many corpora from one process.
+
+    Each corpus gets its own SearchOrchestrator, created the first time the
+    corpus is queried. All orchestrators share a single embedding model.
+    Loaded corpora are kept in least-recently-used order; when their total
+    size exceeds `memory_budget_bytes`, the least recently used are evicted
+    (after saving their query caches) until the rest fits. The corpus just
+    loaded is never evicted, so a corpus larger than the budget is still
+    served, on its own.
+
+    The memory of a corpus is estimated as the size of its files: the
+    indexes and chunk store are memory-mapped, so this is what a fully
+    paged-in corpus occupies.
+
+    `refresh` swaps in newly published generations of loaded corpora: the
+    new build is loaded and warmed up in the background, then replaces the
+    old orchestrator in one step. Queries already running against a
+    replaced or evicted orchestrator finish on it ("drain"); its memory is
+    released once the last of them does.
+    """
+
+    def __init__(self, config, memory_budget_bytes=None):
+        """
+        Args:
+            config (dict): The production config, shared by every corpus.
+            memory_budget_bytes (int, optional): Total size of the corpora
+                kept loaded. Unlimited if None.
+        """
+        self._config = config
+        self.memory_budget_bytes = memory_budget_bytes
+
+        self._embedding_model = None
+        self._model_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()  # corpus name -> orchestrator, least recently used first
+        self._load_locks = {}
+        self._stats = {}
+        self._retired = []  # (corpus name, generation, weak reference, retired at) of draining orchestrators
+
+    @property
+    def embedding_model(self):
+        """The query encoder shared by every corpus, loaded on first use."""
+        with self._model_lock:
+            if self._embedding_model is None:
+                self._embedding_model = EmbeddingModelFactory().get_model(self._config["embedding_model"])
+        return self._embedding_model
+
+    def available(self):
+        """Names of the corpora that have a processed index on disk."""
+        names = [DEFAULT_CORPUS] if (current_dir(corpus_dir(DEFAULT_CORPUS)) / "metadata.json").exists() else []
+        if CORPORA_PATH.is_dir():
+            names.extend(sorted(
+                path.name for path in CORPORA_PATH.iterdir()
+                if re.fullmatch(CORPUS_NAME_PATTERN, path.name) and (current_dir(path) / "metadata.json").exists()
+            ))
+        return names
+
+    def get(self, corpus_name=DEFAULT_CORPUS):
+        """
+        Returns the orchestrator of a corpus, loading it if needed.
+
+        Concurrent requests for a corpus that is not loaded wait for a
+        single load.
+
+        Raises
+        ------
+        KeyError
+            If there is no processed index for the corpus.
+        """
+        with self._lock:
+            orchestrator = self._touch(corpus_name)
+            if orchestrator is not None:
+                return orchestrator
+        if not (current_dir(corpus_dir(corpus_name)) / "metadata.json").exists():
+            raise KeyError(f"Unknown corpus: {corpus_name!r}")
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(corpus_name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                orchestrator = self._touch(corpus_name)
+                if orchestrator is not None:
+                    return orchestrator
+
+            orchestrator, memory_bytes, load_seconds = self._load(corpus_name)
+
+            with self._lock:
+                self._resident[corpus_name] = orchestrator
+                stats = self._stats.setdefault(
+                    corpus_name, {"loads": 0, "evictions": 0, "swaps": 0, "lookups": 0}
+                )
+                now = time.time()
+                stats.update(
+                    loads=stats["loads"] + 1,
+                    lookups=stats["lookups"] + 1,
+                    generation=orchestrator.query_runner.generation,
+                    memory_bytes=memory_bytes,
+                    load_seconds=load_seconds,
+                    loaded_at=now,
+                    last_used=now,
+                )
+                evicted = self._evict_over_budget(keep=corpus_name)
+
+        for _, evicted_orchestrator in evicted:
+            evicted_orchestrator.save_caches()
+        return orchestrator
+
+    def peek(self, corpus_name=DEFAULT_CORPUS):
+        """Returns the orchestrator of a corpus if it is loaded, without loading or touching it."""
+        with self._lock:
+            return self._resident.get(corpus_name)
+
+    def evict(self, corpus_name):
+        """Unloads a corpus, saving its query caches. Returns whether it was loaded."""
+        with self._lock:
+            orchestrator = self._resident.pop(corpus_name, None)
+            if orchestrator is not None:
+                self._stats[corpus_name]["evictions"] += 1
+                self._retire(corpus_name, orchestrator)
+        if orchestrator is None:
+            return False
+        orchestrator.save_caches()
+        return True
+
+    def refresh(self, warmup_queries=()):
+        """
+        Swaps in newly published generations of the loaded corpora.
+
+        For each loaded corpus whose `CURRENT` generation differs from the
+        one it serves, the new build is loaded and `warmup_queries` are run
+        against it on the calling thread. It then replaces the old
+        orchestrator atomically, keeping its place in the LRU order; new
+        lookups get the new build while queries in flight drain on the old
+        one. Corpora that are evicted or swapped meanwhile are skipped.
+
+        Returns:
+            list[str]: The corpora that were swapped.
+        """
+        with self._lock:
+            loaded = [
+                (name, orchestrator.query_runner.generation) for name, orchestrator in self._resident.items()
+            ]
+
+        swapped = []
+        for corpus_name, generation in loaded:
+            published = current_generation(corpus_dir(corpus_name))
+            if published is None or published == generation:
+                continue
+            if self._swap(corpus_name, generation, warmup_queries):
+                swapped.append(corpus_name)
+        return swapped
+
+    def save_caches(self):
+        """Persists the query caches of every loaded corpus."""
+        with self._lock:
+            orchestrators = list(self._resident.values())
+        for orchestrator in orchestrators:
+            orchestrator.save_caches()
+
+    def stats(self):
+        """
+        Memory use against the budget, load and residency stats per corpus,
+        and the replaced generations still draining queries.
+        """
+        with self._lock:
+            now = time.time()
+            self._retired = [entry for entry in self._retired if entry[2]() is not None]
+            indexes = {}
+            for name, stats in self._stats.items():
+                resident = name in self._resident
+                indexes[name] = {
+                    **stats,
+                    "resident": resident,
+                    "resident_seconds": now - stats["loaded_at"] if resident else 0.0,
+                    "caches": self._resident[name].cache_stats() if resident else {},
+                }
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "memory_bytes": self._resident_bytes(),
+                # Least recently used first, i.e. in eviction order
+                "resident": list(self._resident),
+                "indexes": indexes,
+                "draining": [
+                    {"corpus": name, "generation": generation, "retired_seconds": now - retired_at}
+                    for name, generation, _, retired_at in self._retired
+                ],
+            }
+
+    def _touch(self, corpus_name):
+        """Marks a loaded corpus as most recently used. Call with the lock held."""
+        orchestrator = self._resident.get(corpus_name)
+        if orchestrator is not None:
+            self._resident.move_to_end(corpus_name)
+            stats = self._stats[corpus_name]
+            stats["lookups"] += 1
+            stats["last_used"] = time.time()
+        return orchestrator
+
+    def _load(self, corpus_name):
+        logger.info(f"Loading corpus {corpus_name!r}")
+        start_time = time.perf_counter()
+        orchestrator = SearchOrchestrator(
+            config=self._config,
+            corpus_name=None if corpus_name == DEFAULT_CORPUS else corpus_name,
+            embedding_model=self.embedding_model,
+        )
+        load_seconds = time.perf_counter() - start_time
+        memory_bytes = index_bytes(orchestrator.query_runner.resources_dir)
+        logger.info(
+            f"Loaded generation {orchestrator.query_runner.generation} of corpus {corpus_name!r} "
+            f"in {load_seconds:.2f}s ({memory_bytes / 2**20:.1f} MB)"
+        )
+        return orchestrator, memory_bytes, load_seconds
+
+    def _swap(self, corpus_name, generation, warmup_queries):
+        """Loads, warms up and swaps in the published build of a corpus serving `generation`."""
+        with self._load_locks[corpus_name]:
+            with self._lock:
+                current = self._resident.get(corpus_name)
+                if current is None or current.query_runner.generation != generation:
+                    return False
+
+            try:
+                orchestrator, memory_bytes, load_seconds = self._load(corpus_name)
+            except Exception:
+                logger.exception(f"Failed to load the new generation of corpus {corpus_name!r}")
+                return False
+            for query in warmup_queries:
+                try:
+                    orchestrator.search(query)
+                except Exception:
+                    logger.exception(f"Warmup query failed: {query}")
+
+            with self._lock:
+                if self._resident.get(corpus_name) is not current:
+                    return False
+                self._resident[corpus_name] = orchestrator
+                self._retire(corpus_name, current)
+                stats = self._stats[corpus_name]
+                stats.update(
+                    swaps=stats["swaps"] + 1,
+                    generation=orchestrator.query_runner.generation,
+                    memory_bytes=memory_bytes,
+                    load_seconds=load_seconds,
+                    loaded_at=time.time(),
+                )
+                evicted = self._evict_over_budget(keep=corpus_name)
+
+        logger.info(f"Swapped corpus {corpus_name!r} to generation {orchestrator.query_runner.generation}")
+        for _, evicted_orchestrator in evicted:
+            evicted_orchestrator.save_caches()
+        return True
+
+    def _retire(self, corpus_name, orchestrator):
+        """Tracks a replaced or evicted orchestrator until its last query drains. Call with the lock held."""
+        self._retired.append(
+            (corpus_name, orchestrator.query_runner.generation, weakref.ref(orchestrator), time.time())
+        )
+
+    def _resident_bytes(self):
+        return sum(self._stats[name]["memory_bytes"] for name in self._resident)
+
+    def _evict_over_budget(self, keep):
+        """Evicts least recently used corpora until the rest fit the budget. Call with the lock held."""
+        evicted = []
+        if self.memory_budget_bytes is None:
+            return evicted
+        for name in list(self._resident):
+            if self._resident_bytes() <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            logger.info(f"Evicting corpus {name!r} to stay within the memory budget")
+            orchestrator = self._resident.pop(name)
+            evicted.append((name, orchestrator))
+            self._stats[name]["evictions"] += 1
+            self._retire(name, orchestrator)
+        return evicted
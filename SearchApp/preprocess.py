@@ -1,35 +1,67 @@
 import argparse
+import re
 from pathlib import Path
 import importlib.resources
 import json
-from SearchApp.constants import DEFAULT_DATA_DIR
+from SearchApp.constants import CORPUS_NAME_PATTERN, DEFAULT_CORPUS, DEFAULT_DATA_DIR
+from path_utils import EMBEDDING_CACHE_PATH
 from Core.corpus_processor import CorpusProcessor
 from Core.embeddings_manager import EmbeddingManager
+from Core.embedding_cache import EmbeddingCache
 from Core.keyword_manager import KeywordManager
 from Core.corpus_data import CorpusData
+from Core.tokenizer import download_nltk_resources
 
 
-def preprocess(data_dir=DEFAULT_DATA_DIR):
+def preprocess(data_dir=DEFAULT_DATA_DIR, corpus_name=None):
+    """
+    Builds the indexes of a corpus.
+
+    Args:
+        data_dir (Path): Directory containing markdown files.
+        corpus_name (str, optional): Builds a named corpus that the API
+            serves next to the others. Defaults to the production index.
+    """
+    if corpus_name == DEFAULT_CORPUS:
+        corpus_name = None
+    if corpus_name is not None and not re.fullmatch(CORPUS_NAME_PATTERN, corpus_name):
+        raise ValueError(f"Invalid corpus name: {corpus_name!r}")
     print(f"Preprocessing data from: {data_dir}")
 
     if not isinstance(data_dir, Path):
         data_dir = Path(data_dir)
 
-    corpus = CorpusData(data_dir)
-
-    embedding_manager = EmbeddingManager()
-    keyword_manager = KeywordManager(dataset_name=corpus.dataset_name)
-
     with importlib.resources.files(__package__).joinpath("production_config.json").open("r") as f:
         production_config = json.load(f)
 
+    # The query path only looks NLTK data up, so fetch it as part of setup
+    download_nltk_resources()
+
+    ingestion_config = production_config.get("ingestion", {})
+    corpus = CorpusData(
+        data_dir,
+        streaming=ingestion_config.get("streaming", False),
+        read_workers=ingestion_config.get("read_workers", 8),
+    )
+
+    model_name = production_config["embedding_model"]
+    cache_config = production_config.get("embedding_cache", {})
+    cache = (
+        EmbeddingCache(EMBEDDING_CACHE_PATH, model_name, max_entries=cache_config["max_entries"])
+        if cache_config.get("enabled") else None
+    )
+
+    embedding_manager = EmbeddingManager(model_name=model_name, cache=cache)
+    keyword_manager = KeywordManager(dataset_name=corpus.dataset_name)
+
     corpus_processor = CorpusProcessor(
         corpus=corpus,
         config=production_config,
         dataset_name=corpus.dataset_name,
         embedding_manager=embedding_manager,
         keyword_manager=keyword_manager,
-        testing=False
+        testing=False,
+        corpus_name=corpus_name,
     )
 
     corpus_processor.process()
@@ -38,6 +70,8 @@ def preprocess(data_dir=DEFAULT_DATA_DIR):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Preprocess markdown files into embeddings.")
     parser.add_argument("--data-dir", type=str, default=DEFAULT_DATA_DIR, help="Directory containing markdown files.")
+    parser.add_argument("--corpus-name", type=str, default=None,
+                        help="Name to serve the corpus under. Defaults to the production index.")
     args = parser.parse_args()
 
-    preprocess(args.data_dir)
+    preprocess(args.data_dir, args.corpus_name)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """
+    Groups concurrent search requests into micro-batches.
+
+    Requests are queued as they arrive. A single worker task takes the first
+    waiting request, keeps collecting more for up to `max_wait_ms` or until
+    `max_batch_size` are queued, and runs the whole batch through
+    `search_many` on a worker thread. Each request then gets its own
+    results back. While a batch is running, new requests queue up for the
+    next one, so under load batches fill without waiting.
+    """
+
+    def __init__(self, search_many, max_wait_ms=5, max_batch_size=32):
+        """
+        Args:
+            search_many (Callable[[list], list]): Runs a batch of queries
+                and returns one result per query, in order. Queries are
+                passed through as submitted, e.g. `(corpus, query)` pairs.
+            max_wait_ms (float): How long to wait for a batch to fill.
+            max_batch_size (int): Maximum number of queries per batch.
+        """
+        self._search_many = search_many
+        self._max_wait = max_wait_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+
+        self.batches = 0
+        self.queries = 0
+
+    def start(self):
+        """Starts the batching worker. Must be called from a running event loop."""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, query):
+        """Queues a query and waits for its results."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests whose client went away are dropped from the batch
+            batch = [(query, future) for query, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.queries += len(batch)
+            queries = [query for query, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self._search_many, queries)
+            except Exception as e:
+                logger.exception(f"Batch of {len(batch)} queries failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -4,6 +4,7 @@ import textwrap
 from pathlib import Path
 import importlib.resources
 from path_utils import PROCESSED_DATA_PATH
+from SearchApp.constants import DEFAULT_CORPUS
 from SearchApp.search_orchestrator import SearchOrchestrator
 
 def main():
@@ -12,23 +13,21 @@ def main():
     """
     parser = argparse.ArgumentParser(description="Semantic Search CLI")
     parser.add_argument("--query", type=str, required=True, help="Enter a search query.")
+    parser.add_argument("--corpus-name", type=str, default=DEFAULT_CORPUS, help="Corpus to search.")
     args = parser.parse_args()
 
 
-    id_mapping_path = PROCESSED_DATA_PATH / "Production" / "id_mapping.json"
-    with open(id_mapping_path, "r") as f:
-        id_mapping = json.load(f)
-
     with importlib.resources.files(__package__).joinpath("production_config.json").open("r") as f:
         production_config = json.load(f)
 
 
     orchestrator = SearchOrchestrator(
         config=production_config,
-        id_mapping=id_mapping
+        corpus_name=None if args.corpus_name == DEFAULT_CORPUS else args.corpus_name,
     )
 
     results = orchestrator.search(args.query)
+    orchestrator.save_caches()  # Lets the next invocation reuse this query
 
     print(format_search_results(results))
 
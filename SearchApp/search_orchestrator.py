@@ -1,8 +1,11 @@
 import logging
-from path_utils import DEFAULT_DATA_PATH
+import re
+import threading
 from Core.query_runner import QueryRunner
 from Core.ranker import Ranker
-from Core.corpus_data import CorpusData
+from Core.chunk_store import ChunkStore
+from Core.query_cache import QueryCache
+from Core.generations import query_cache_dir
 
 logger = logging.getLogger(__name__)
 
@@ -14,17 +17,94 @@ class SearchOrchestrator:
     - Running semantic search with vector embeddings
     - Running keyword search
     - Ranking and formatting results
+
+    The indexes are memory-mapped when the orchestrator is created. The
+    corpus and the chunk store are only read the first time they are needed.
+
+    When `query_cache` is enabled in the config, ranked results are cached
+    per (index generation, normalized query, fusion settings, k), and the
+    query runner caches query embeddings. Both caches can be persisted in the
+    corpus directory, per generation, so separate CLI invocations share them.
     """
 
-    def __init__(self, config, id_mapping):
+    def __init__(self, config, corpus_name=None, embedding_model=None):
+        """
+        Args:
+            config (dict): The production config.
+            corpus_name (str, optional): Serves a named corpus from
+                `ProcessedData/Corpora` instead of the production index.
+            embedding_model (SentenceTransformer, optional): A query encoder
+                shared with other orchestrators in the process.
+        """
         logger.info(f"Initializing SearchOrchestrator")
 
-        self.corpus = CorpusData(DEFAULT_DATA_PATH)
-        self._id_mapping = id_mapping
+        self._chunk_store = None
+        self._lazy_load_lock = threading.Lock()
 
-        self.query_runner = QueryRunner("Production", config)
+        # No corpus name selects the production indexes
+        self.query_runner = QueryRunner(None, config, corpus_name=corpus_name, embedding_model=embedding_model)
         self.ranker = Ranker(config)
 
+        cache_config = config.get("query_cache", {})
+        self._result_cache = (
+            QueryCache(cache_config.get("max_entries", 1024), cache_config.get("ttl_seconds"))
+            if cache_config.get("enabled", False) else None
+        )
+        self._persist_caches = cache_config.get("persist", False)
+        self._fusion_key = (
+            tuple(config["semantic_vs_keyword_weights"]),
+            config.get("fusion", {}).get("method", "weighted_sum"),
+            config.get("fusion", {}).get("rrf_k", 60),
+            config.get("top_k", 5),
+        )
+        if self._persist_caches:
+            self._load_caches()
+
+    @property
+    def chunk_store(self):
+        with self._lazy_load_lock:
+            if self._chunk_store is None:
+                self._chunk_store = ChunkStore.load(self.query_runner.resources_dir / "chunk_store")
+        return self._chunk_store
+
+    def cache_stats(self):
+        """Hit ratios and memory use of the query caches, if enabled."""
+        stats = {}
+        if self._result_cache is not None:
+            stats["results"] = self._result_cache.stats()
+        if self.query_runner.embedding_cache is not None:
+            stats["embeddings"] = self.query_runner.embedding_cache.stats()
+        return stats
+
+    def save_caches(self):
+        """Persists the query caches, if configured to."""
+        if not self._persist_caches:
+            return
+        if not self.query_runner.resources_dir.exists():
+            # The generation was pruned while it was still being served
+            return
+        cache_dir = self._cache_dir()
+        if self._result_cache is not None:
+            self._result_cache.save(cache_dir / "results.pkl")
+        if self.query_runner.embedding_cache is not None:
+            self.query_runner.embedding_cache.save(cache_dir / "embeddings.pkl")
+
+    def _cache_dir(self):
+        # Not inside the generation directory, which is immutable once published
+        return query_cache_dir(self.query_runner.corpus_dir, self.query_runner.generation)
+
+    def _load_caches(self):
+        cache_dir = self._cache_dir()
+        generation = self.query_runner.generation
+        if self._result_cache is not None:
+            self._result_cache.load(cache_dir / "results.pkl", generation)
+        if self.query_runner.embedding_cache is not None:
+            self.query_runner.embedding_cache.load(cache_dir / "embeddings.pkl", generation)
+
+    def _result_cache_key(self, query):
+        normalized_query = re.sub(r"\s+", " ", query).strip().lower()
+        return (self.query_runner.generation, normalized_query, *self._fusion_key)
+
     def search(self, query):
         """
         Processes a search query and returns ranked results.
@@ -37,14 +117,47 @@ class SearchOrchestrator:
         """
         logger.info(f"Processing query: {query}")
 
+        if self._result_cache is not None:
+            cached_results = self._result_cache.get(self._result_cache_key(query))
+            if cached_results is not None:
+                return cached_results
+
         annoy_scores, keyword_scores = self.query_runner.query(query)
 
         ranking_matrix = self.ranker.rank(annoy_scores, keyword_scores)
 
         formatted_results = self._format_results(ranking_matrix)
 
+        if self._result_cache is not None:
+            self._result_cache.put(self._result_cache_key(query), formatted_results)
+
         return formatted_results
 
+    def search_many(self, queries):
+        """
+        Processes a batch of search queries in one pass.
+
+        Args:
+            queries (list[str]): The user's search queries.
+
+        Returns:
+            list[list[dict]]: Ranked search results for each query, in order.
+        """
+        logger.info(f"Processing batch of {len(queries)} queries")
+
+        results = [None] * len(queries)
+        if self._result_cache is not None:
+            results = [self._result_cache.get(self._result_cache_key(query)) for query in queries]
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        all_scores = self.query_runner.query_many([queries[i] for i in misses])
+        for i, (annoy_scores, keyword_scores) in zip(misses, all_scores):
+            results[i] = self._format_results(self.ranker.rank(annoy_scores, keyword_scores))
+            if self._result_cache is not None:
+                self._result_cache.put(self._result_cache_key(queries[i]), results[i])
+
+        return results
+
     def _format_results(self, ranking_matrix):
         """
         Formats the ranked search results into a structured list.
@@ -58,7 +171,7 @@ class SearchOrchestrator:
         top_hits_ids = list(ranking_matrix["ID"])
         combined_similarity = list(ranking_matrix["Combined_Score"])
 
-        top_hits = [self._id_mapping[str(x)] for x in top_hits_ids]
+        top_hits = [self.chunk_store.get(x) for x in top_hits_ids]
 
         results = []
         for i, hit in enumerate(top_hits):
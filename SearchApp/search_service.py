@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from SearchApp.constants import DEFAULT_CORPUS
+from SearchApp.index_registry import IndexRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class SearchService:
+    """
+    Owns the index registry behind the API and manages its startup.
+
+    Every corpus is served through an IndexRegistry, which loads corpora on
+    demand and evicts them under its memory budget. The production index
+    (the "default" corpus) is loaded eagerly, on a background thread so the
+    process can start answering health checks immediately:
+        1. The default orchestrator is created, which loads the embedding
+           model and memory-maps the indexes.
+        2. The configured warmup queries are run so the first real request
+           does not pay for lazy loading or cold caches.
+        3. Any corpora listed in `index_registry.preload` are loaded.
+
+    The service is "loaded" after step 1 and "ready" after step 2.
+
+    With `hot_swap.enabled`, a watcher thread checks every
+    `hot_swap.poll_seconds` whether a new generation of a loaded corpus was
+    published, and has the registry load, warm up and swap it in while
+    queries keep being served, so a reindex needs no restart.
+    """
+
+    def __init__(self, config):
+        self._config = config
+        startup_config = config.get("startup", {})
+        self._warmup_queries = startup_config.get("warmup_queries", [])
+        self._load_timeout = startup_config.get("load_timeout_seconds", 30)
+
+        registry_config = config.get("index_registry", {})
+        memory_budget_mb = registry_config.get("memory_budget_mb")
+        self.registry = IndexRegistry(
+            config, memory_budget_bytes=memory_budget_mb * 2**20 if memory_budget_mb is not None else None
+        )
+        self._preload = registry_config.get("preload", [])
+
+        hot_swap_config = config.get("hot_swap", {})
+        self._poll_seconds = (
+            hot_swap_config.get("poll_seconds", 5) if hot_swap_config.get("enabled", False) else None
+        )
+        self._stop = threading.Event()
+        self._watcher = None
+
+        self._loaded = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = None
+        self.timings = {}
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        """Starts loading and warming up, and watching for new generations, in the background."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, name="search-warmup", daemon=True)
+            self._thread.start()
+        if self._poll_seconds is not None and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="search-hot-swap", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        """Stops watching for new generations."""
+        self._stop.set()
+
+    def get_orchestrator(self, corpus_name=DEFAULT_CORPUS):
+        """
+        Returns the orchestrator of a corpus.
+
+        The default corpus is waited for until its startup load finishes;
+        other corpora are loaded by the calling thread if needed.
+
+        Raises
+        ------
+        RuntimeError
+            If the default corpus failed to load or did not finish within
+            the load timeout.
+        KeyError
+            If there is no processed index for the corpus.
+        """
+        self.start()
+        if corpus_name != DEFAULT_CORPUS:
+            return self.registry.get(corpus_name)
+        if not self._loaded.wait(self._load_timeout):
+            raise RuntimeError("Search indexes are still loading.")
+        if self._error is not None:
+            raise RuntimeError("Search indexes failed to load.") from self._error
+        return self.registry.get(DEFAULT_CORPUS)
+
+    def search_many(self, requests):
+        """
+        Runs a batch of `(corpus_name, query)` requests.
+
+        Queries are grouped by corpus, so each corpus runs its share of the
+        batch in one `search_many` call.
+
+        Returns:
+            list[list[dict]]: Ranked results for each request, in order.
+        """
+        by_corpus = {}
+        for i, (corpus_name, query) in enumerate(requests):
+            by_corpus.setdefault(corpus_name, []).append((i, query))
+
+        results = [None] * len(requests)
+        for corpus_name, indexed_queries in by_corpus.items():
+            orchestrator = self.get_orchestrator(corpus_name)
+            corpus_results = orchestrator.search_many([query for _, query in indexed_queries])
+            for (i, _), result in zip(indexed_queries, corpus_results):
+                results[i] = result
+        return results
+
+    def status(self):
+        loaded = self._loaded.is_set() and self._error is None
+        default_orchestrator = self.registry.peek(DEFAULT_CORPUS)
+        return {
+            "loaded": loaded,
+            "ready": self.ready,
+            "error": repr(self._error) if self._error is not None else None,
+            "timings": self.timings,
+            "caches": default_orchestrator.cache_stats() if default_orchestrator is not None else {},
+            "indexes": self.registry.stats(),
+        }
+
+    def save_caches(self):
+        """Persists the query caches of every loaded corpus."""
+        self.registry.save_caches()
+
+    def _load(self):
+        start_time = time.perf_counter()
+        try:
+            orchestrator = self.registry.get(DEFAULT_CORPUS)
+        except Exception as e:
+            logger.exception("Failed to load search indexes")
+            self._error = e
+            self._loaded.set()
+            self._preload_corpora()  # Named corpora can be served without a production index
+            return
+        self.timings["load_seconds"] = time.perf_counter() - start_time
+        self._loaded.set()
+
+        start_time = time.perf_counter()
+        for query in self._warmup_queries:
+            try:
+                orchestrator.search(query)
+            except Exception:
+                logger.exception(f"Warmup query failed: {query}")
+        self.timings["warmup_seconds"] = time.perf_counter() - start_time
+
+        logger.info(f"Search service ready: {self.timings}")
+        self._ready.set()
+        self._preload_corpora()
+
+    def _watch(self):
+        while not self._stop.wait(self._poll_seconds):
+            try:
+                self.registry.refresh(self._warmup_queries)
+            except Exception:
+                logger.exception("Checking for new index generations failed")
+
+    def _preload_corpora(self):
+        for corpus_name in self._preload:
+            try:
+                self.registry.get(corpus_name)
+            except Exception:
+                logger.exception(f"Failed to preload corpus {corpus_name!r}")
@@ -2,7 +2,10 @@ import argparse
 from logger import logger
 from TestRunner.test_orchestrator import TestOrchestrator
 from Core.embeddings_manager import EmbeddingManager
+from Core.embedding_cache import EmbeddingCache
+from path_utils import EMBEDDING_CACHE_PATH
 from Core.keyword_manager import KeywordManager
+from Core.tokenizer import download_nltk_resources
 
 
 def main():
@@ -21,12 +24,23 @@ def main():
         "--dataset-name",
         help="Name of dataset used for testing"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes that run grid search stages in parallel",
+    )
     args = parser.parse_args()
     single_config_path = args.single_config_path
     dataset_name = args.dataset_name
     mode = args.mode
 
-    em = EmbeddingManager()
+    # Test builds tokenize like preprocessing, which fetches NLTK data up front
+    download_nltk_resources()
+
+    # The cache is shared by every config in the grid, so sentences that
+    # several split methods produce are only encoded once.
+    em = EmbeddingManager(cache=EmbeddingCache(EMBEDDING_CACHE_PATH, "all-MiniLM-L6-v2"))
     km = KeywordManager(
         dataset_name=dataset_name,
     )
@@ -37,6 +51,7 @@ def main():
         embedding_manager=em,
         keyword_manager=km,
         single_config_path=single_config_path,
+        workers=args.workers,
     )
     logger.info("Begining testing process")
     to.orchestrate()
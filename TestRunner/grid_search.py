@@ -0,0 +1,412 @@
+"""
+Grid search as a memoized DAG of stages.
+
+Every config of a grid runs through the same chain of stages:
+
+    embed -> index -> query -> evaluate
+
+- embed: splits, tokenizes and embeds the corpus and builds its BM25
+  index, with an exact (NumPy) vector index as the store of its vectors.
+  Splitting and embedding happen in one streaming pass of the
+  CorpusProcessor, so they are one stage.
+- index: builds the configured vector index from those vectors, reusing
+  the chunks, tokens and embeddings of the embed stage.
+- query: runs every test query against the index.
+- evaluate: ranks the scores, checks them against the ground truth and
+  writes the results file of the config.
+
+A stage is keyed only by the config fields it depends on and by the key
+of the stage before it, so configs that share a prefix of stages share
+its work: a grid that varies the fusion weights embeds, indexes and
+queries once. Outputs are pickled under `STAGE_CACHE_PATH/<stage>`, so a
+rerun, or a later grid overlapping an earlier one, only runs the stages
+it has not seen. Stages whose inputs are ready run in parallel in a
+process pool.
+"""
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from config import PROCESSED_DATA_PATH
+from path_utils import STAGE_CACHE_PATH
+from Core.corpus_processor import CorpusProcessor
+from Core.embeddings_manager import EmbeddingManager
+from Core.generations import current_dir
+from Core.keyword_manager import KeywordManager
+from Core.query_runner import QueryRunner
+from factories.corpus_factory import create_corpus
+from factories.embedding_model_factory import EmbeddingModelFactory
+from .config import DATASETS_PATH
+from .factory import create_test_runner
+from .models import QuestionAnswer
+from .test_runner import select_test_cases
+
+logger = logging.getLogger(__name__)
+
+# The vector index of the embed stage; it is only read back for its vectors
+EXACT_BACKEND = {"type": "numpy"}
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    # Config fields the stage depends on. None for every field no earlier
+    # stage depends on.
+    fields: Optional[tuple]
+    # Whether the output names a processed corpus that must still exist
+    builds: bool = False
+
+
+STAGES = (
+    Stage("embed", ("split_methods", "embedding_model", "sentence_segmentation"), builds=True),
+    Stage("index", ("vector_backend", "annoy_trees"), builds=True),
+    Stage("query", ("top_k", "keyword_retrieval", "vector_search")),
+    Stage("evaluate", None),
+)
+
+
+@dataclass
+class _Node:
+    stage: Stage
+    key: str
+    config: dict  # The first config that reaches the node
+    parent: Optional[str]
+    children: list = field(default_factory=list)
+
+
+class _StageContext:
+    """
+    What the stages of one process share: the corpus, the managers and
+    the models.
+
+    Outside a worker process the managers passed to the GridSearch are
+    used, including the embedding cache of the EmbeddingManager, for the
+    configs whose embedding model it was created with. Other models, and
+    worker processes, get managers of their own without a cache: it is
+    keyed by a single model and not safe to write from several processes.
+    """
+
+    def __init__(self, dataset_name, corpus=None, embedding_manager=None, keyword_manager=None):
+        self.dataset_name = dataset_name
+        self.corpus = corpus or create_corpus(DATASETS_PATH / Path(dataset_name))
+        self.keyword_manager = keyword_manager or KeywordManager(dataset_name=dataset_name)
+        self._embedding_manager = embedding_manager
+        self._embedding_managers = {}
+        self._embedding_models = {}
+        self._test_cases = None
+
+    def embedding_manager(self, model_name):
+        if self._embedding_manager is not None and self._embedding_manager.model_name == model_name:
+            return self._embedding_manager
+        if model_name not in self._embedding_managers:
+            self._embedding_managers[model_name] = EmbeddingManager(model_name=model_name)
+        return self._embedding_managers[model_name]
+
+    def embedding_model(self, model_name):
+        """The query encoder, loaded once per process."""
+        if model_name not in self._embedding_models:
+            self._embedding_models[model_name] = EmbeddingModelFactory().get_model(model_name)
+        return self._embedding_models[model_name]
+
+    def test_cases(self):
+        if self._test_cases is None:
+            self._test_cases = select_test_cases(QuestionAnswer(self.dataset_name))
+        return self._test_cases
+
+
+def _run_embed(context, config, parent_output):
+    config = {**config, "vector_backend": EXACT_BACKEND}
+    processor = CorpusProcessor(
+        context.corpus,
+        config,
+        context.dataset_name,
+        context.embedding_manager(config["embedding_model"]),
+        context.keyword_manager,
+        testing=True,
+    )
+    return {"processed_corpus_id": processor.process()}
+
+
+def _run_index(context, config, parent_output):
+    # Unchanged files are copied from the embed build, so nothing is split
+    # or embedded again. A config that asks for the exact backend resolves
+    # to the embed build itself, which `process` then skips.
+    processor = CorpusProcessor(
+        context.corpus,
+        config,
+        context.dataset_name,
+        context.embedding_manager(config["embedding_model"]),
+        context.keyword_manager,
+        testing=True,
+        seed_dir=PROCESSED_DATA_PATH / "Testing" / parent_output["processed_corpus_id"],
+    )
+    return {"processed_corpus_id": processor.process()}
+
+
+def _run_query(context, config, parent_output):
+    query_runner = QueryRunner(
+        parent_output["processed_corpus_id"],
+        config,
+        embedding_model=context.embedding_model(config["embedding_model"]),
+    )
+    scores = query_runner.query_many([test_case["query"] for test_case in context.test_cases()])
+    return {**parent_output, "scores": scores}
+
+
+def _run_evaluate(context, config, parent_output):
+    test_runner = create_test_runner(
+        context.dataset_name,
+        context.corpus,
+        parent_output["processed_corpus_id"],
+        config,
+    )
+    return test_runner.evaluate(context.test_cases(), parent_output["scores"])
+
+
+_STAGE_RUNNERS = {
+    "embed": _run_embed,
+    "index": _run_index,
+    "query": _run_query,
+    "evaluate": _run_evaluate,
+}
+
+
+def _run_stage(context, stage_name, config, parent_output):
+    return _STAGE_RUNNERS[stage_name](context, config, parent_output)
+
+
+# Per-process state of the worker processes, set by `_init_worker`
+_worker_context = None
+
+
+def _init_worker(dataset_name):
+    global _worker_context
+    _worker_context = _StageContext(dataset_name)
+
+
+def _run_in_worker(stage_name, config, parent_output):
+    return _run_stage(_worker_context, stage_name, config, parent_output)
+
+
+def stage_key(stage, dataset_name, config, parent_key):
+    """Hash of the stage, the config fields it depends on and the key of its parent."""
+    fields = stage.fields
+    if fields is None:
+        claimed = {name for other in STAGES if other.fields for name in other.fields}
+        fields = sorted(set(config) - claimed)
+    key_settings = {
+        "stage": stage.name,
+        "dataset_name": dataset_name,
+        "fields": {name: config.get(name) for name in fields},
+        "parent": parent_key,
+    }
+    return hashlib.md5(json.dumps(key_settings, sort_keys=True).encode()).hexdigest()
+
+
+class GridSearch:
+    """
+    Runs the configs of a grid as a memoized DAG of stages.
+
+    See the module docstring for the stages. With `workers` > 1, stages
+    run in a pool of that many processes, each of which loads its own
+    models; with 1 they run one at a time in this process.
+    """
+
+    def __init__(
+        self,
+        dataset_name,
+        corpus,
+        embedding_manager,
+        keyword_manager,
+        workers=1,
+        cache_dir=STAGE_CACHE_PATH,
+    ):
+        self._dataset_name = dataset_name
+        self._workers = workers
+        self._cache_dir = Path(cache_dir)
+        self._context = _StageContext(dataset_name, corpus, embedding_manager, keyword_manager)
+
+    def run(self, configs):
+        """
+        Runs every config.
+
+        Returns:
+            list[dict]: Per config, the path of its results file and its
+                top hit overlap ratio, or None if one of its stages failed.
+        """
+        nodes, leaves = self._build_dag(configs)
+        counts = {stage.name: sum(node.stage is stage for node in nodes.values()) for stage in STAGES}
+        logger.info(
+            f"{len(configs)} configurations share "
+            + ", ".join(f"{count} {name}" for name, count in counts.items())
+            + " stages."
+        )
+
+        outputs = self._execute(nodes)
+
+        results = [outputs.get(leaf) for leaf in leaves]
+        ranked = sorted(
+            (i for i, result in enumerate(results) if result is not None),
+            key=lambda i: results[i]["top_hit_overlap_ratio"],
+            reverse=True,
+        )
+        for i in ranked:
+            logger.info(
+                f"Configuration {i}: top hit overlap {results[i]['top_hit_overlap_ratio']:.4f} "
+                f"({results[i]['results_path']})"
+            )
+        return results
+
+    def _build_dag(self, configs):
+        """Returns the stage nodes by key and the key of the last stage of each config."""
+        nodes = {}
+        leaves = []
+        for config in configs:
+            parent_key = None
+            for stage in STAGES:
+                key = stage_key(stage, self._dataset_name, config, parent_key)
+                if key not in nodes:
+                    nodes[key] = _Node(stage, key, config, parent_key)
+                    if parent_key is not None:
+                        nodes[parent_key].children.append(key)
+                parent_key = key
+            leaves.append(parent_key)
+        return nodes, leaves
+
+    def _execute(self, nodes):
+        """
+        Runs the nodes once their parent has finished, reading finished
+        stages from the stage cache. Returns the output of every node that
+        succeeded; the descendants of a failed node are skipped.
+
+        If a worker process dies (e.g. out of memory), the pool is replaced
+        and every stage that was running in it is rerun on its own, with
+        nothing else in flight. A stage that breaks the pool on its own
+        fails; the others go on as usual.
+        """
+        outputs = {}
+        stats = {"ran": 0, "cached": 0, "failed": 0, "skipped": 0}
+        ready = [key for key, node in nodes.items() if node.parent is None]
+        pending = {}  # future -> (node, executor it was submitted to, whether it ran alone)
+        suspects = set()  # Nodes that were running when a worker died
+
+        def fail(node):
+            stats["failed"] += 1
+            descendants = list(node.children)
+            while descendants:
+                stats["skipped"] += 1
+                descendants.extend(nodes[descendants.pop()].children)
+
+        executor, run = self._create_executor()
+        try:
+            while ready or pending:
+                deferred = []
+                while ready and not any(alone for _, _, alone in pending.values()):
+                    node = nodes[ready.pop()]
+                    parent_output = outputs[node.parent] if node.parent is not None else None
+                    cached = self._load_output(node)
+                    if cached is not None:
+                        stats["cached"] += 1
+                        outputs[node.key] = cached
+                        ready.extend(node.children)
+                        continue
+                    alone = node.key in suspects
+                    if alone and pending:
+                        deferred.append(node.key)
+                        continue
+                    try:
+                        future = executor.submit(run, node.stage.name, node.config, parent_output)
+                    except BrokenProcessPool:
+                        executor, run = self._replace_executor(executor)
+                        ready.append(node.key)
+                        continue
+                    pending[future] = (node, executor, alone)
+                ready.extend(deferred)
+                if not pending:
+                    continue
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, submitted_to, alone = pending.pop(future)
+                    try:
+                        output = future.result()
+                    except BrokenProcessPool:
+                        if submitted_to is executor:
+                            executor, run = self._replace_executor(executor)
+                        if alone:
+                            logger.error(
+                                f"Stage {node.stage.name} failed for configuration {node.config}: "
+                                "its worker process died"
+                            )
+                            fail(node)
+                        else:
+                            suspects.add(node.key)
+                            ready.append(node.key)
+                        continue
+                    except Exception:
+                        logger.exception(f"Stage {node.stage.name} failed for configuration {node.config}")
+                        fail(node)
+                        continue
+                    stats["ran"] += 1
+                    self._save_output(node, output)
+                    outputs[node.key] = output
+                    ready.extend(node.children)
+        finally:
+            executor.shutdown(wait=True)
+
+        logger.info(
+            f"Ran {stats['ran']} stages, reused {stats['cached']} from the stage cache, "
+            f"{stats['failed']} failed and {stats['skipped']} were skipped after a failure."
+        )
+        return outputs
+
+    def _replace_executor(self, executor):
+        logger.warning("A grid search worker died; starting a new process pool.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return self._create_executor()
+
+    def _create_executor(self):
+        """Returns a stage executor and the function it runs stages with."""
+        if self._workers > 1:
+            # Spawned rather than forked: this process may have torch loaded
+            executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self._dataset_name,),
+            )
+            return executor, _run_in_worker
+        return ThreadPoolExecutor(max_workers=1), functools.partial(_run_stage, self._context)
+
+    def _output_path(self, node):
+        return self._cache_dir / node.stage.name / f"{node.key}.pkl"
+
+    def _load_output(self, node):
+        """The memoized output of a node, or None if it has to run."""
+        path = self._output_path(node)
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            output = pickle.load(f)
+        if node.stage.builds:
+            processed_dir = PROCESSED_DATA_PATH / "Testing" / output["processed_corpus_id"]
+            if not (current_dir(processed_dir) / "metadata.json").exists():
+                return None
+        return output
+
+    def _save_output(self, node, output):
+        path = self._output_path(node)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(output, f)
+        os.replace(tmp_path, path)
@@ -9,6 +9,7 @@ import json
 import itertools
 from Core.corpus_processor import CorpusProcessor
 from .factory import create_test_runner
+from .grid_search import GridSearch
 from factories.corpus_factory import create_corpus
 from logger import logger
 
@@ -23,7 +24,13 @@ class TestOrchestrator:
         keyword_manager,
         single_config_path=None,
         grid_config_path=None,
+        workers=1,
     ):
+        """
+        Args:
+            workers (int): Processes that run the stages of a grid search
+                in parallel.
+        """
         self._dataset_name = dataset_name
         self._mode = mode
         self._single_config_path = single_config_path
@@ -32,6 +39,7 @@ class TestOrchestrator:
 
         self._embedding_manager = embedding_manager
         self._keyword_manager = keyword_manager
+        self._workers = workers
 
     def orchestrate(self):
         if self._mode == "grid":
@@ -39,9 +47,15 @@ class TestOrchestrator:
             logger.info("Creating config set for grid test run.")
             configs = self._generate_combinations(config_space)
             logger.info(f"{len(configs)} configurations will be tested.")
-            for i, config in enumerate(configs):
-                logger.info(f"Testing configuration {i}")
-                self.run_test(config)
+            # Configs share the stages their settings have in common
+            grid_search = GridSearch(
+                self._dataset_name,
+                self._corpus,
+                self._embedding_manager,
+                self._keyword_manager,
+                workers=self._workers,
+            )
+            grid_search.run(configs)
         elif self._mode == "single" and self._single_config_path:
             logger.info("Testing single configuration.")
             with open(self._single_config_path, "r") as f:
@@ -4,11 +4,24 @@ import random
 
 from pathlib import Path
 from logger import logger
-from .config import TEST_RESULTS_PATH, PROCESSED_DATA_PATH
+from .config import TEST_RESULTS_PATH
+from config import PROCESSED_DATA_PATH
+from Core.chunk_store import ChunkStore
+from Core.generations import current_dir
 from Core.results_processors import TestingResultProcessor
 from Core.query_runner import QueryRunner
 from Core.ranker import Ranker
-from factories.embedding_model_factory import EmbeddingModelFactory
+
+
+def select_test_cases(qa):
+    """The test cases of a QuestionAnswer set that have a query, in order."""
+    test_cases = []
+    for test_case in qa.question_answer:
+        if not test_case.get("query", ""):
+            print(f"Skipping test case: Missing query in {test_case}")
+            continue
+        test_cases.append(test_case)
+    return test_cases
 
 
 class TestRunner:
@@ -48,8 +61,8 @@ class TestRunner:
         self._dataset_name = dataset_name
         self._corpus = corpus
         self._processed_corpus_id = processed_corpus_id
-        self._qr = QueryRunner(processed_corpus_id, config)
-        (self._id_mapping, self._metadata) = self._load_resources()
+        self._qr = None  # Created on first query; `evaluate` does not need it
+        (self._chunk_store, self._metadata) = self._load_resources()
         self._ranker = Ranker(config)
         self._config = config
         self._qa = qa
@@ -58,10 +71,6 @@ class TestRunner:
 
         self._similarity_calculator = similarity_calculator
 
-        model_name = config["embedding_model"]
-        emf = EmbeddingModelFactory()
-        self._embedding_model = emf.get_model(model_name)
-
         self._results_processor = TestingResultProcessor(corpus)
 
     def _load_resources(self):
@@ -75,9 +84,10 @@ class TestRunner:
                 PROCESSED_DATA_PATH / Path("Production")
             )
         )
-        id_mapping = self._load_json_resource(resources_dir, "id_mapping")
+        resources_dir = current_dir(resources_dir)
+        chunk_store = ChunkStore.load(resources_dir / "chunk_store")
         metadata = self._load_json_resource(resources_dir, "metadata")
-        return (id_mapping, metadata)
+        return (chunk_store, metadata)
 
     def _load_json_resource(self, resources_dir, name):
         path = resources_dir / Path(f"{name}.json")
@@ -89,22 +99,44 @@ class TestRunner:
         """
         Execute the tests and save the results.
         """
+        random.shuffle(self._qa.question_answer)  # Shuffle to make debugging more illuminating
+        test_cases = select_test_cases(self._qa)
+
+        # Every query is encoded and scored in one batch
+        if self._qr is None:
+            self._qr = QueryRunner(self._processed_corpus_id, self._config)
+        all_scores = self._qr.query_many([test_case["query"] for test_case in test_cases])
+
+        self.evaluate(test_cases, all_scores)
+
+    def evaluate(self, test_cases, all_scores):
+        """
+        Ranks the scores of each test case, checks the hits against the
+        ground truth and writes the results.
+
+        Parameters:
+        -----------
+        test_cases : list[dict]
+            The test cases, as returned by `select_test_cases`.
+        all_scores : list[tuple]
+            The `QueryRunner.query_many` output for the test case queries.
+
+        Returns:
+        --------
+        dict
+            The path of the results file and the top hit overlap ratio.
+        """
         case_by_case_results = []
         top_hit_overlaps_count = 0
-        random.shuffle(self._qa.question_answer)  # Shuffle to make debugging more illuminating
-        for test_case in self._qa.question_answer:
-            query = test_case.get("query", "")
+
+        for test_case, (annoy_scores, keyword_scores) in zip(test_cases, all_scores):
+            query = test_case["query"]
             ground_truth = {
                 "doc": test_case.get("answer_doc", ""),
                 "position": test_case.get("answer_position", ""),
                 "text": test_case.get("answer_text", ""),
             }
 
-            if not query:
-                print(f"Skipping test case: Missing query in {test_case}")
-                continue
-
-            annoy_scores, keyword_scores = self._qr.query(query)
             ranking_matrix = self._ranker.rank(annoy_scores, keyword_scores)
             formatted_top_hits = self._format_for_results_processor(ranking_matrix)
 
@@ -121,26 +153,20 @@ class TestRunner:
             "results": case_by_case_results,
         }
         logger.info("Test complete, writing results.")
-        self._write_results(final_results, top_hit_overlap_ratio)
+        results_path = self._write_results(final_results, top_hit_overlap_ratio)
+        return {"results_path": str(results_path), "top_hit_overlap_ratio": top_hit_overlap_ratio}
 
     def _format_for_results_processor(self, ranking_matrix):
         top_hits_ids = list(ranking_matrix["ID"])
         combined_similarity = list(ranking_matrix["Combined_Score"])
         semantic_similarity = list(ranking_matrix["Semantic_Score"])
         keyword_similarity = list(ranking_matrix["Keyword_Score"])
-        top_hits_data = [self._id_mapping[str(id)] for id in top_hits_ids]
+        top_hits_data = [self._chunk_store.get(id) for id in top_hits_ids]
 
         for i, res in enumerate(top_hits_data):
             res.update({"similarity": combined_similarity[i]})
             res.update({"semantic_similarity": semantic_similarity[i]})
             res.update({"keyword_similarity": keyword_similarity[i]})
-            res.update(
-                {
-                    "text": self._corpus.find_passage(
-                        res.get("location"), res.get("char_range")
-                    )
-                }
-            )
         return top_hits_data
 
     def _rank_results(self, top_hits_data):
@@ -164,17 +190,10 @@ class TestRunner:
 
     def _extract_top_hits_data(self, annoy_output):
         top_hits_ids, similarities = annoy_output[0], annoy_output[1]
-        top_hits_data = [self._id_mapping[str(id)] for id in top_hits_ids]
+        top_hits_data = [self._chunk_store.get(id) for id in top_hits_ids]
 
         for i, res in enumerate(top_hits_data):
             res.update({"similarity": similarities[i]})
-            res.update(
-                {
-                    "text": self._corpus.find_passage(
-                        res.get("location"), res.get("char_range")
-                    )
-                }
-            )
         return top_hits_data
 
     def _query_documents(self, embedded_query):
@@ -203,12 +222,18 @@ class TestRunner:
         -----------
         final_results : dict
             The final results dictionary containing metadata and results.
+
+        Returns:
+        --------
+        Path
+            The path of the written file.
         """
         file_name = self._generate_test_filepath(top_hit_overlap_ratio)
         file_name.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
         with open(file_name, "w") as json_file:
             json.dump(final_results, json_file, indent=4)
         logger.info(f"Results written to {file_name}")
+        return file_name
 
     def _generate_test_filepath(self, top_hit_overlap_ratio, extension="json"):
         """
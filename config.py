@@ -2,3 +2,5 @@ from pathlib import Path
 
 
 PROCESSED_DATA_PATH = Path(__file__).resolve().parent / "ProcessedData"
+# One directory per named corpus served alongside the production index
+CORPORA_PATH = PROCESSED_DATA_PATH / "Corpora"
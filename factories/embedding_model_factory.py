@@ -1,16 +1,27 @@
-from typing import Callable
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+
+def _load_sentence_transformer(model_name: str) -> "SentenceTransformer":
+    # Imported here: sentence_transformers pulls in torch, which takes
+    # seconds to import and is only needed once a model is requested
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
 
 class EmbeddingModelFactory:
     """
     Factory class for fetching and initializing language models.
     """
     def __init__(self):
-        self._registry: dict[str, Callable[[], SentenceTransformer]] = {
-            "all-MiniLM-L6-v2": lambda: SentenceTransformer("all-MiniLM-L6-v2"),
+        self._registry: dict[str, Callable[[], "SentenceTransformer"]] = {
+            "all-MiniLM-L6-v2": lambda: _load_sentence_transformer("all-MiniLM-L6-v2"),
         }
 
-    def get_model(self, model_name: str) -> SentenceTransformer:
+    def get_model(self, model_name: str) -> "SentenceTransformer":
         if model_name not in self._registry:
             raise ValueError(f"Unsupported model: {model_name}")
         return self._registry[model_name]()
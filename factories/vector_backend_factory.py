@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from Core.vector_backends import AnnoyBackend, IVFBackend, NumpyBackend, VectorBackend
+
+DEFAULT_VECTOR_BACKEND = {"type": "annoy"}
+
+
+class VectorBackendFactory:
+    """
+    Factory class for creating and loading vector backends.
+
+    Backends are described by a config dict such as `{"type": "numpy"}`;
+    every other key is passed to the backend's constructor as an option.
+    """
+    def __init__(self):
+        self._registry: dict[str, type[VectorBackend]] = {
+            AnnoyBackend.name: AnnoyBackend,
+            NumpyBackend.name: NumpyBackend,
+            IVFBackend.name: IVFBackend,
+        }
+
+    def get_backend_class(self, backend_config: dict) -> type[VectorBackend]:
+        backend_type = backend_config.get("type", DEFAULT_VECTOR_BACKEND["type"])
+        if backend_type not in self._registry:
+            raise ValueError(f"Unsupported vector backend: {backend_type}")
+        return self._registry[backend_type]
+
+    def create(self, backend_config: dict, dim: int) -> VectorBackend:
+        return self.get_backend_class(backend_config)(dim, **self._options(backend_config))
+
+    def load(self, backend_config: dict, directory: Path, dim: int) -> VectorBackend:
+        return self.get_backend_class(backend_config).load(directory, dim, **self._options(backend_config))
+
+    @staticmethod
+    def _options(backend_config):
+        return {key: value for key, value in backend_config.items() if key != "type"}
@@ -8,6 +8,9 @@ QUESTION_ANSWER_PATH = ROOT_DIR / "TestRunner" / "QuestionAnswer"
 NOTEBOOKS_PATH = ROOT_DIR / "Notebooks"
 TEST_RESULTS_PATH = ROOT_DIR / "TestRunner" / "TestResults"
 EMBEDDINGS_PATH = ROOT_DIR / "Embeddings"
+EMBEDDING_CACHE_PATH = EMBEDDINGS_PATH / "Cache"
 GRID_SEARCH_CONFIG_PATH = ROOT_DIR / "TestRunner" / "grid_search_config.json"
 PROCESSED_DATA_PATH = ROOT_DIR / "ProcessedData"
 
+# Memoized outputs of the grid search stages
+STAGE_CACHE_PATH = ROOT_DIR / "TestRunner" / "StageCache"
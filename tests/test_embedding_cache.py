@@ -0,0 +1,26 @@
+import numpy as np
+
+from Core.embedding_cache import EmbeddingCache
+
+
+def _text_with_nul_terminated_key(cache):
+    for i in range(10_000):
+        text = f"chunk {i}"
+        if cache.key(text).endswith(b"\x00"):
+            return text
+    raise AssertionError("No text hashed to a key ending in a NUL byte")
+
+
+def test_key_ending_in_nul_survives_reload(tmp_path):
+    cache = EmbeddingCache(tmp_path, "test-model", dim=4)
+    text = _text_with_nul_terminated_key(cache)
+    vector = np.arange(4, dtype=np.float32)
+    cache.put_many([text], [vector])
+    cache.flush()
+
+    reloaded = EmbeddingCache(tmp_path, "test-model", dim=4)
+    assert len(reloaded) == 1
+    np.testing.assert_array_equal(reloaded.get_many([text])[0], vector)
+
+    reloaded.put_many([text], [vector])
+    assert reloaded._n_rows == 1